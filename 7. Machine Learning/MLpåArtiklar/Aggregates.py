@@ -0,0 +1,238 @@
+# Description: Pre-aggregated tables the dashboard reads instead of scanning
+# every article. Each aggregate is updated by Storage.upsert_articles in the
+# same transaction as the inserted articles, so the tables never disagree with
+# the 'news' table. Storage.ensure_schema fills empty tables from the stored
+# articles (e.g. on the first run after an upgrade); they can be recomputed with:
+#
+# Usage: python Aggregates.py --rebuild
+import argparse
+import datetime
+import urllib.parse
+from collections import Counter
+
+import Storage
+import TextNormalizer
+
+# Category key for "all articles" (the dashboard filter "Alla")
+ALL_CATEGORIES = "alla"
+
+# Words left out of the word cloud in addition to nltk's Swedish stopwords
+WORDCLOUD_STOPWORDS = {
+    "img", "jpg", "png", "https", "säger", "ska", "år", "bör", "kommer", "måste",
+    "kan", "ska", "vill", "finns", "bli", "får", "gör", "mer", "nya", "tar", "tog",
+    "fick", "få", "fler", "första", "hela", "stor", "därför", "det", "du", "jag",
+    "han", "hon", "den", "det", "de", "vi", "ni", "man", "en", "ett", "alla",
+    "så", "här", "inte", "att", "är", "och", "eller", "men", "som", "vad", "vilka",
+    "vilket", "med", "till", "mot", "efter", "under", "före", "in", "ut", "på",
+    "av", "om", "vid", "från", "mellan", "mot", "över", "under", "någon", "något",
+    "några", "hans", "hennes", "dess", "deras", "min", "mitt", "mina", "din",
+    "ditt", "dina", "vår", "vårt", "våra", "er", "ert", "era", "dn", "svd", "gp",
+    "går", "ta", "se", "göra", "ökar", "nytt", "ny", "inför", "flera", "bra", "aldrig", "igen"
+}
+
+# Longest token stored in token_counts
+MAX_TOKEN_LENGTH = 100
+
+_title_stopwords = None
+
+def title_stopwords():
+    """
+    Returns the word cloud stopwords (nltk's Swedish list plus WORDCLOUD_STOPWORDS).
+    """
+    global _title_stopwords
+    if _title_stopwords is None:
+        _title_stopwords = TextNormalizer.swedish_stopwords() | frozenset(WORDCLOUD_STOPWORDS)
+    return _title_stopwords
+
+def title_tokens(title, stop_words):
+    """
+    Returns the word cloud words of a title: lowercase, letters only, no stopwords.
+    """
+    return [token for token in TextNormalizer.tokenize(title, stop_words)
+            if len(token) > 1 and token.isalpha() and len(token) <= MAX_TOKEN_LENGTH]
+
+def article_day(published):
+    """
+    Returns the publication day as "YYYY-MM-DD", or None if it is unknown.
+    Args:
+        published (str or datetime): "YYYY-MM-DD HH:MM:SS" or a DATETIME value.
+    """
+    if isinstance(published, (datetime.date, datetime.datetime)):
+        return f"{published:%Y-%m-%d}"
+    if isinstance(published, str) and len(published) >= 10:
+        try:
+            return datetime.date.fromisoformat(published[:10]).isoformat()
+        except ValueError:
+            return None
+    return None
+
+def row_categories(row):
+    """
+    Returns ALL_CATEGORIES plus the flag column of every category of an article row.
+    Args:
+        row (tuple): Article row in Storage.NEWS_COLUMNS order.
+    """
+    flags = row[len(Storage.NEWS_COLUMNS) - len(Storage.CATEGORY_COLUMNS):]
+    return [ALL_CATEGORIES] + [column for column, flag in zip(Storage.CATEGORY_COLUMNS.values(), flags) if flag]
+
+def article_source(link):
+    """
+    Returns the site an article comes from, e.g. "dn.se" for "https://www.dn.se/...".
+    """
+    host = urllib.parse.urlsplit(link or "").hostname or ""
+    return (host[4:] if host.startswith("www.") else host)[:255]
+
+class DailyCounts:
+    """
+    Article counts per publication day, filter category and source, with the
+    sum of every category flag, used for the charts on the "Analys" page.
+    A row with category 'politik' counts the articles flagged politik and how
+    many of those also carry each of the other categories.
+    """
+
+    table = "daily_counts"
+    flag_columns = tuple(Storage.CATEGORY_COLUMNS.values())
+    create_sql = {
+        "mysql": f"""
+        CREATE TABLE IF NOT EXISTS daily_counts (
+            day DATE NOT NULL,
+            category VARCHAR(32) NOT NULL,
+            source VARCHAR(255) NOT NULL,
+            articles INT NOT NULL,
+            {", ".join(f"{column} INT NOT NULL" for column in flag_columns)},
+            PRIMARY KEY (category, day, source)
+        ) CHARACTER SET utf8mb4
+        """,
+        "sqlite": f"""
+        CREATE TABLE IF NOT EXISTS daily_counts (
+            day TEXT NOT NULL,
+            category TEXT NOT NULL,
+            source TEXT NOT NULL,
+            articles INTEGER NOT NULL,
+            {", ".join(f"{column} INTEGER NOT NULL" for column in flag_columns)},
+            PRIMARY KEY (category, day, source)
+        ) WITHOUT ROWID
+        """
+    }
+    _columns = ("day", "category", "source", "articles") + flag_columns
+    upsert_sql = {
+        "mysql": f"""
+        INSERT INTO daily_counts ({", ".join(_columns)}) VALUES ({", ".join(["%s"] * len(_columns))})
+        ON DUPLICATE KEY UPDATE
+        {", ".join(f"{column} = {column} + VALUES({column})" for column in _columns[3:])}
+        """,
+        "sqlite": f"""
+        INSERT INTO daily_counts ({", ".join(_columns)}) VALUES ({", ".join(["?"] * len(_columns))})
+        ON CONFLICT(category, day, source) DO UPDATE SET
+        {", ".join(f"{column} = {column} + excluded.{column}" for column in _columns[3:])}
+        """
+    }
+
+    def update(self, storage, cursor, rows):
+        """
+        Adds newly inserted articles to the daily counts.
+        Args:
+            storage (Storage): The storage (selects the SQL dialect).
+            cursor: Cursor inside the insert transaction.
+            rows (list): Inserted article rows in Storage.NEWS_COLUMNS order.
+        """
+        first_flag = len(Storage.NEWS_COLUMNS) - len(self.flag_columns)
+        counts = {}
+        for row in rows:
+            day = article_day(row[3])
+            if day is None:
+                continue
+            flags = [1 if flag else 0 for flag in row[first_flag:]]
+            source = article_source(row[2])
+            for category in row_categories(row):
+                totals = counts.setdefault((day, category, source), [0] * (1 + len(flags)))
+                totals[0] += 1
+                for i, flag in enumerate(flags, 1):
+                    totals[i] += flag
+        if counts:
+            cursor.executemany(self.upsert_sql[storage.dialect],
+                               [(*key, *totals) for key, totals in counts.items()])
+
+class TokenCounts:
+    """
+    Title word frequencies per publication day and category, used for the word cloud.
+    """
+
+    table = "token_counts"
+    create_sql = {
+        "mysql": """
+        CREATE TABLE IF NOT EXISTS token_counts (
+            day DATE NOT NULL,
+            category VARCHAR(32) NOT NULL,
+            token VARCHAR(100) NOT NULL,
+            occurrences INT NOT NULL,
+            PRIMARY KEY (category, day, token)
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin
+        """,
+        "sqlite": """
+        CREATE TABLE IF NOT EXISTS token_counts (
+            day TEXT NOT NULL,
+            category TEXT NOT NULL,
+            token TEXT NOT NULL,
+            occurrences INTEGER NOT NULL,
+            PRIMARY KEY (category, day, token)
+        ) WITHOUT ROWID
+        """
+    }
+    upsert_sql = {
+        "mysql": """
+        INSERT INTO token_counts (day, category, token, occurrences) VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE occurrences = occurrences + VALUES(occurrences)
+        """,
+        "sqlite": """
+        INSERT INTO token_counts (day, category, token, occurrences) VALUES (?, ?, ?, ?)
+        ON CONFLICT(category, day, token) DO UPDATE SET occurrences = occurrences + excluded.occurrences
+        """
+    }
+
+    def update(self, storage, cursor, rows):
+        """
+        Adds the title words of newly inserted articles to the table.
+        Args:
+            storage (Storage): The storage (selects the SQL dialect).
+            cursor: Cursor inside the insert transaction.
+            rows (list): Inserted article rows in Storage.NEWS_COLUMNS order.
+        """
+        stop_words = title_stopwords()
+        counts = Counter()
+        for row in rows:
+            day = article_day(row[3])
+            if day is None:
+                continue
+            tokens = Counter(title_tokens(row[0], stop_words))
+            for category in row_categories(row):
+                for token, occurrences in tokens.items():
+                    counts[(day, category, token)] += occurrences
+        if counts:
+            cursor.executemany(self.upsert_sql[storage.dialect],
+                               [(*key, occurrences) for key, occurrences in counts.items()])
+
+# Aggregates maintained on every insert (see Storage.upsert_articles)
+AGGREGATES = (TokenCounts(), DailyCounts())
+
+def rebuild(storage, aggregates=AGGREGATES, batch_size=Storage.REBUILD_BATCH_SIZE):
+    """
+    Recomputes the aggregate tables from all stored articles in one transaction.
+    Returns:
+        int: Number of articles processed.
+    """
+    return storage.rebuild_aggregates(aggregates, batch_size)
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the dashboard aggregate tables.")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the tables from all stored articles")
+    args = parser.parse_args()
+
+    storage = Storage.get_storage()
+    storage.aggregates = AGGREGATES
+    storage.ensure_schema()
+    if args.rebuild:
+        print(f"Rebuilt the aggregates from {rebuild(storage)} articles.")
+
+if __name__ == "__main__":
+    main()
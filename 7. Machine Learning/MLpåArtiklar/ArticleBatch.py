@@ -0,0 +1,261 @@
+# Description: Compact, column-oriented batch of articles passed between the
+# pipeline stages (MLModelReturns_4 -> DbTransfer_5) instead of lists of dicts.
+# Text fields are stored as one list per column and the predicted categories as
+# a boolean sparse label matrix. BatchValidator checks a whole batch at once
+# against the article JSON schema and reports the failing row indices.
+# to_table() and from_table() convert a batch to and from an Arrow table (one
+# boolean column per category), the layout Pipeline.py stores as Parquet.
+# numpy, scipy, pyarrow and jsonschema are imported where they are used, so importing
+# this module (e.g. through DbTransfer_5) does not load them.
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "summary": {"type": "string"},
+        "link": {"type": "string"},
+        "published": {"type": "string"},
+        "topic": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["title", "summary", "link", "published", "topic"]
+}
+
+TEXT_COLUMNS = ("title", "summary", "link", "published")
+
+class ArticleBatch:
+    """
+    A batch of articles stored column by column.
+    Args:
+        title, summary, link, published (list): One value per article.
+        labels (csr_matrix): Boolean (n_articles, n_categories) label matrix, or None.
+        categories (list): Category names matching the label matrix columns.
+    """
+
+    __slots__ = ("title", "summary", "link", "published", "labels", "categories")
+
+    def __init__(self, title, summary, link, published, labels=None, categories=()):
+        self.title = title
+        self.summary = summary
+        self.link = link
+        self.published = published
+        self.categories = list(categories)
+        if labels is None:
+            from scipy import sparse
+
+            labels = sparse.csr_matrix((len(title), len(self.categories)), dtype=bool)
+        self.labels = labels
+
+    @classmethod
+    def from_records(cls, records, categories=None):
+        """
+        Builds a batch from article dictionaries ('topic' lists are optional).
+        Args:
+            records (list): Dicts with 'title', 'summary', 'link', 'published' and maybe 'topic'.
+            categories (list): Category names for the label matrix; taken from
+                               the topics in the records when None.
+        Returns:
+            ArticleBatch: The batch.
+        """
+        import numpy as np
+        from scipy import sparse
+
+        records = list(records)
+        if categories is None:
+            categories = sorted({topic for record in records for topic in record.get("topic") or ()})
+        column = {category: i for i, category in enumerate(categories)}
+        rows, cols = [], []
+        for row, record in enumerate(records):
+            for topic in record.get("topic") or ():
+                if topic in column:
+                    rows.append(row)
+                    cols.append(column[topic])
+        labels = sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)),
+                                   shape=(len(records), len(categories)))
+        return cls(
+            [record.get("title", "") for record in records],
+            [record.get("summary", "") for record in records],
+            [record.get("link", "") for record in records],
+            [record.get("published", "") for record in records],
+            labels, categories
+        )
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        Builds a batch from an Arrow table or record batch holding the
+        TEXT_COLUMNS and one boolean column per category.
+        """
+        import numpy as np
+        from scipy import sparse
+
+        categories = [name for name in table.column_names if name not in TEXT_COLUMNS]
+        flags = [table.column(name).to_numpy(zero_copy_only=False).astype(bool) for name in categories]
+        labels = sparse.csr_matrix(np.column_stack(flags) if flags else (table.num_rows, 0), dtype=bool)
+        return cls(*(table.column(name).to_pylist() for name in TEXT_COLUMNS), labels, categories)
+
+    def __len__(self):
+        return len(self.link)
+
+    def texts(self):
+        """
+        Returns the combined "title summary" string of every article.
+        """
+        return [f"{title} {summary}" for title, summary in zip(self.title, self.summary)]
+
+    def topics(self):
+        """
+        Returns one list of category names per article.
+        """
+        indptr, indices = self.labels.indptr.tolist(), self.labels.indices.tolist()
+        categories = self.categories
+        return [[categories[i] for i in indices[indptr[row]:indptr[row + 1]]] for row in range(len(self))]
+
+    def take(self, rows):
+        """
+        Returns a new batch with only the given row indices.
+        """
+        rows = list(rows)
+        return ArticleBatch(
+            [self.title[i] for i in rows],
+            [self.summary[i] for i in rows],
+            [self.link[i] for i in rows],
+            [self.published[i] for i in rows],
+            self.labels[rows], self.categories
+        )
+
+    def to_records(self):
+        """
+        Converts the batch back into article dictionaries.
+        """
+        return [
+            {"title": title, "summary": summary, "link": link, "published": published, "topic": topic}
+            for title, summary, link, published, topic
+            in zip(self.title, self.summary, self.link, self.published, self.topics())
+        ]
+
+    def to_table(self):
+        """
+        Converts the batch into an Arrow table: the TEXT_COLUMNS as strings and
+        one boolean column per category.
+        """
+        import pyarrow as pa
+
+        dense = self.labels.toarray()
+        columns = {name: pa.array(getattr(self, name), pa.string()) for name in TEXT_COLUMNS}
+        columns.update({category: pa.array(dense[:, i], pa.bool_()) for i, category in enumerate(self.categories)})
+        return pa.table(columns)
+
+    def param_tuples(self, category_columns, rows=None):
+        """
+        Builds the database parameter tuples straight from the columns.
+        Args:
+            category_columns (iterable): Category names in database flag column order.
+            rows (iterable): Row indices to include, all rows when None.
+        Returns:
+            list: (title, summary, link, published, topic string, *flags) per article.
+        """
+        import numpy as np
+
+        rows = range(len(self)) if rows is None else list(rows)
+        column = {category: i for i, category in enumerate(self.categories)}
+        order = [column.get(category) for category in category_columns]
+        dense = self.labels[list(rows)].toarray() if len(rows) else np.zeros((0, len(self.categories)), bool)
+        flag_rows = np.zeros((len(rows), len(order)), dtype=np.int8)
+        for target, source in enumerate(order):
+            if source is not None:
+                flag_rows[:, target] = dense[:, source]
+        names = np.array(self.categories, dtype=object)
+        return [
+            (self.title[i], self.summary[i], self.link[i], self.published[i],
+             ",".join(names[dense[n]]), *flag_rows[n].tolist())
+            for n, i in enumerate(rows)
+        ]
+
+class BatchValidator:
+    """
+    Validator compiled once from a JSON schema and applied to whole batches.
+    When the schema only constrains the types of the article fields (as SCHEMA
+    does) the checks run over whole columns and give exactly the jsonschema
+    result; any other schema (lengths, formats, ...) is checked row by row
+    with the compiled jsonschema validator. jsonschema also produces the
+    error messages for the rows that failed.
+    Args:
+        schema (dict): Object schema of an article record.
+    """
+
+    # JSON types the column checks handle, and their Python types
+    _json_types = {"string": str, "null": type(None)}
+
+    # The only 'topic' schema the column checks handle (categories are strings)
+    _topic_schema = {"type": "array", "items": {"type": "string"}}
+
+    def __init__(self, schema=SCHEMA):
+        import jsonschema
+
+        self.schema = schema
+        self.validator = jsonschema.validators.validator_for(schema)(schema)
+        self.column_types = self._column_types(schema)
+
+    @classmethod
+    def _column_types(cls, schema):
+        """
+        Returns the accepted Python types of every constrained text column, or
+        None when the schema uses anything the column checks cannot express.
+        """
+        properties = schema.get("properties", {})
+        if schema.get("type") != "object" or set(schema) - {"type", "properties", "required"}:
+            return None
+        if not set(schema.get("required", ())) <= set(TEXT_COLUMNS) | {"topic"}:
+            return None
+        if properties.get("topic", cls._topic_schema) != cls._topic_schema:
+            return None
+        column_types = {}
+        for name in TEXT_COLUMNS:
+            spec = properties.get(name, {})
+            if set(spec) - {"type"}:
+                return None
+            if "type" in spec:
+                names = spec["type"] if isinstance(spec["type"], list) else [spec["type"]]
+                if not set(names) <= set(cls._json_types):
+                    return None
+                column_types[name] = tuple(cls._json_types[type_name] for type_name in names)
+        return column_types
+
+    def failing_rows(self, batch):
+        """
+        Returns the sorted indices of the rows that do not match the schema.
+        """
+        if batch.labels.shape[0] != len(batch) or not all(isinstance(c, str) for c in batch.categories):
+            return list(range(len(batch)))
+        if self.column_types is None:
+            return [row for row, record in enumerate(batch.to_records()) if not self.validator.is_valid(record)]
+        failing = set()
+        for name, expected in self.column_types.items():
+            failing.update(row for row, value in enumerate(getattr(batch, name))
+                           if not isinstance(value, expected))
+        return sorted(failing)
+
+    def errors(self, batch, rows):
+        """
+        Returns a jsonschema error message for each of the given rows.
+        """
+        import jsonschema
+
+        records = batch.take(rows).to_records() if batch.labels.shape[0] == len(batch) else []
+        messages = {}
+        for row, record in zip(rows, records):
+            error = jsonschema.exceptions.best_match(self.validator.iter_errors(record))
+            messages[row] = error.message if error else "invalid label row"
+        return messages
+
+    def validate(self, batch):
+        """
+        Validates a whole batch.
+        Returns:
+            tuple: (batch with the valid rows, list of failing row indices)
+        """
+        failing = self.failing_rows(batch)
+        if not failing:
+            return batch, []
+        failing_set = set(failing)
+        return batch.take(row for row in range(len(batch)) if row not in failing_set), failing
@@ -0,0 +1,869 @@
+# Description: Benchmark suite for the hot paths of the pipeline and the dashboard.
+# Runs fully offline: RSS fixture feeds are generated from Book1.csv and served
+# from a local HTTP server, the training data is Book1.csv scaled synthetically
+# (every copy gets shuffled word order and its own links), and the database is
+# a temporary SQLite file. Fetching is also timed against feeds that answer
+# after FIXTURE_DELAYS, one at a time and concurrently. Each stage reports
+# throughput, latency percentiles and peak memory (tracemalloc). Results can be saved as a baseline and later
+# runs compared against it to detect regressions between versions.
+# Everything runs in a temporary working directory, with the stem cache moved
+# there as well, so the stem cache and the model registry of the project are left untouched.
+# --imports checks startup instead: fresh interpreters run with -X importtime
+# must reach the first fetch of DbTransfer_5, and render the "Start" and "Data"
+# pages of the dashboard, without loading the modules in PIPELINE_LAZY_MODULES
+# and DASHBOARD_LAZY_MODULES. Any such import is reported and exits with 1.
+# --parity checks the fused scorer (MLModelReturns_4.FusedScorer) against
+# predict_proba of the TF-IDF, compact and incremental models, and times both
+# for growing batch sizes and label counts. A difference above PARITY_TOLERANCE
+# (PARITY_TOLERANCE_FLOAT32 for float32 weights) exits with 1.
+# --feed-state checks conditional fetching against the fixture server: the feed
+# state is not saved by the fetch itself (a failed store refetches the feeds),
+# once saved the next fetch sends If-None-Match and gets 304 responses, and a
+# feed that misses the deadline is fetched again on the next run.
+#
+# Usage: python Benchmark.py [--scales 10 100 1000] [--repeat 5] [--save NAME] [--compare NAME]
+#        python Benchmark.py --imports
+#        python Benchmark.py --parity
+#        python Benchmark.py --feed-state
+
+import argparse
+import contextlib
+import copy
+import datetime
+import email.utils
+import hashlib
+import http.server
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import RssArticles_1
+import RssFeedNewArticle_2
+import FullRSSList_1_2
+import MLModelMLC_3
+import MLModelReturns_4
+import DbTransfer_5
+import DashboardData
+import Storage
+import TextNormalizer
+from ArticleBatch import ArticleBatch
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Training data that is scaled up
+DATA_PATH = os.path.join(SCRIPT_DIR, "Book1.csv")
+
+# Saved benchmark results (baselines)
+BENCHMARK_DIR = os.path.join(SCRIPT_DIR, "benchmarks")
+
+# Dataset scale factors (copies of Book1.csv)
+DEFAULT_SCALES = (10, 100, 1000)
+
+# Training is skipped above this scale (the grid search grows with the data)
+MAX_TRAIN_SCALE = 100
+
+# Timed runs per stage (the memory run comes on top)
+REPEAT = 3
+
+# Fixture feeds served by the local HTTP server
+FIXTURE_FEEDS = 20
+ITEMS_PER_FEED = 50
+
+# Response delays (seconds) of the slow fixture feeds, one per feed. The
+# fetch_delayed stages download them one at a time and concurrently.
+FIXTURE_DELAYS = (0.05, 0.1, 0.2, 0.3, 0.5, 1.0)
+
+# Sources the synthetic articles are spread over (used by the daily rollup)
+SOURCES = ("dn.se", "svd.se", "svt.se", "gp.se", "aftonbladet.se")
+
+# Repetitions of every dashboard query
+QUERY_REPEAT = 20
+
+# A stage is a regression when its median latency grows by more than this share
+REGRESSION_TOLERANCE = 0.2
+
+# Modules DbTransfer_5 must not have loaded when it starts fetching
+PIPELINE_LAZY_MODULES = ("sklearn", "scipy", "numpy", "pandas", "joblib", "nltk", "jsonschema",
+                         "matplotlib", "plotly", "wordcloud")
+
+# Modules the "Start" and "Data" pages must not load (streamlit itself loads
+# plotly.graph_objects and the pages need pandas, so those are allowed)
+DASHBOARD_LAZY_MODULES = ("sklearn", "scipy", "joblib", "nltk", "jsonschema", "matplotlib",
+                          "wordcloud", "plotly.express")
+DASHBOARD_PAGES = ("Start", "Data")
+
+# Slowest imports listed per check
+IMPORT_REPORT_SIZE = 10
+
+# Largest allowed probability difference between the fused scorer and predict_proba
+# (float32 weights, as in the compact model, are rounded differently by sklearn)
+PARITY_TOLERANCE = 1e-9
+PARITY_TOLERANCE_FLOAT32 = 1e-4
+
+# Batch sizes and label counts (the categories repeated) timed by --parity
+PARITY_BATCH_SIZES = (10, 100, 1000, 10000)
+PARITY_LABEL_COUNTS = (10, 40, 160)
+
+# Run in a fresh interpreter: replaces the RSS fetch with a probe that prints
+# the loaded modules, then lets DbTransfer_5 run to the end without articles
+PIPELINE_PROBE = """
+import json, sys
+import RssArticles_1
+
+def first_fetch():
+    print("MODULES " + json.dumps(sorted(sys.modules)), flush=True)
+    RssArticles_1.posts = []
+
+RssArticles_1.main = first_fetch
+import DbTransfer_5
+DbTransfer_5.main()
+"""
+
+# Run in a fresh interpreter: renders the given pages with streamlit's AppTest
+# (the option menu is replaced by the page name) and prints the loaded modules
+DASHBOARD_PROBE = """
+import json, sys
+import streamlit_option_menu
+from streamlit.testing.v1 import AppTest
+
+for page in sys.argv[2:]:
+    streamlit_option_menu.option_menu = lambda *args, page=page, **kwargs: page
+    app = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+    if app.exception:
+        sys.exit(f"Page {page} failed: {app.exception[0].value}")
+print("MODULES " + json.dumps(sorted(sys.modules)), flush=True)
+"""
+
+def load_data(path=DATA_PATH):
+    """
+    Reads the labeled training CSV.
+    """
+    return pd.read_csv(path)
+
+def scale_data(data, scale, seed=0):
+    """
+    Builds a synthetic dataset with 'scale' copies of every row. The first copy
+    is the original; later copies shuffle the words of each heading, so the
+    vocabulary stays realistic without identical rows.
+    Args:
+        data (DataFrame): Book1.csv.
+        scale (int): Number of copies.
+        seed (int): Random seed.
+    Returns:
+        DataFrame: The scaled dataset with unique 'Id' values.
+    """
+    rng = random.Random(seed)
+    headings = data['Heading'].astype(str).tolist()
+    copies = [data]
+    for copy in range(1, scale):
+        shuffled = []
+        for heading in headings:
+            words = heading.split()
+            rng.shuffle(words)
+            shuffled.append(" ".join(words))
+        copies.append(data.assign(Heading=shuffled))
+    scaled = pd.concat(copies, ignore_index=True)
+    scaled['Id'] = np.arange(1, len(scaled) + 1)
+    return scaled
+
+def article_records(data, start_day=datetime.date(2025, 1, 25), days=35):
+    """
+    Yields article dictionaries (as produced by FullRSSList_1_2) for every row.
+    """
+    for i, heading in enumerate(data['Heading'].astype(str)):
+        day = start_day + datetime.timedelta(days=i % days)
+        yield {
+            'title': heading,
+            'summary': heading,
+            'link': f"https://www.{SOURCES[i % len(SOURCES)]}/benchmark/{i}",
+            'published': f"{day:%Y-%m-%d} {i % 24:02d}:{i % 60:02d}:00"
+        }
+
+def labeled_batches(data, categories, chunk_size=MLModelReturns_4.CHUNK_SIZE):
+    """
+    Yields ArticleBatch chunks labeled with the Book1.csv categories (no model needed).
+    """
+    labels = data[categories].to_numpy(dtype=bool)
+    records = article_records(data)
+    for start in range(0, len(data), chunk_size):
+        chunk = [next(records) for _ in range(min(chunk_size, len(data) - start))]
+        batch = ArticleBatch.from_records(chunk, categories)
+        batch.labels = sparse.csr_matrix(labels[start:start + len(chunk)])
+        yield batch
+
+class FixtureServer:
+    """
+    Local HTTP server with generated RSS feeds ("/feed/0" ... "/feed/N-1").
+    Every feed has an ETag; a request with a matching If-None-Match gets 304.
+    The status of every response is appended to 'statuses'.
+    Args:
+        headings (list): Headlines used as item titles and descriptions.
+        feeds (int): Number of feeds.
+        items (int): Items per feed.
+        delays (list): Seconds every response of feed i waits (delays[i]), none when None.
+    """
+
+    def __init__(self, headings, feeds=FIXTURE_FEEDS, items=ITEMS_PER_FEED, delays=None):
+        self.bodies = {}
+        self.delays = {f"/feed/{feed}": delays[feed] for feed in range(feeds)} if delays else {}
+        now = datetime.datetime(2025, 2, 28, 12, 0, tzinfo=datetime.timezone.utc)
+        for feed in range(feeds):
+            entries = []
+            for item in range(items):
+                heading = escape(headings[(feed * items + item) % len(headings)])
+                published = email.utils.format_datetime(now - datetime.timedelta(hours=feed * items + item))
+                entries.append(f"<item><title>{heading}</title><description>{heading}</description>"
+                               f"<link>https://www.{SOURCES[feed % len(SOURCES)]}/feed/{feed}/{item}</link>"
+                               f"<pubDate>{published}</pubDate></item>")
+            self.bodies[f"/feed/{feed}"] = (
+                '<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel>'
+                f"<title>Fixture {feed}</title>{''.join(entries)}</channel></rss>"
+            ).encode("utf-8")
+
+        self.etags = {path: f'"{hashlib.sha256(body).hexdigest()[:16]}"' for path, body in self.bodies.items()}
+        self.statuses = []
+        bodies, delays, etags, statuses = self.bodies, self.delays, self.etags, self.statuses
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(delays.get(self.path, 0))
+                body = bodies.get(self.path)
+                if body is None:
+                    statuses.append(404)
+                    self.send_error(404)
+                    return
+                if self.headers.get("If-None-Match") == etags[self.path]:
+                    statuses.append(304)
+                    self.send_response(304)
+                    self.send_header("ETag", etags[self.path])
+                    self.end_headers()
+                    return
+                statuses.append(200)
+                self.send_response(200)
+                self.send_header("ETag", etags[self.path])
+                self.send_header("Content-Type", "application/rss+xml; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def urls(self):
+        host, port = self.server.server_address
+        return [f"http://{host}:{port}{path}" for path in self.bodies]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+def measure(func, items, repeat=REPEAT, trace_memory=True):
+    """
+    Benchmarks one stage. func() is run once under tracemalloc for the peak
+    memory and then 'repeat' times for the timings. When func() returns a
+    list of latencies (per chunk or per query) the percentiles are taken over
+    those, otherwise over the run times. Output of the stage is suppressed.
+    Args:
+        func (callable): The stage; returns None or a list of latencies in seconds.
+        items (int): Items processed per run (articles, headlines, queries).
+        repeat (int): Number of timed runs.
+        trace_memory (bool): Do the extra tracemalloc run.
+    Returns:
+        dict: items, runs, seconds (median run), items_per_second, p50_ms,
+              p95_ms, p99_ms and peak_memory_mb.
+    """
+    peak = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        if trace_memory:
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        run_times, latencies = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            run_times.append(time.perf_counter() - start)
+            if isinstance(result, list):
+                latencies.extend(result)
+    seconds = float(np.median(run_times))
+    percentiles = np.percentile(latencies or run_times, [50, 95, 99]) * 1000
+    return {
+        'items': items,
+        'runs': repeat,
+        'seconds': round(seconds, 6),
+        'items_per_second': round(items / seconds, 1) if seconds > 0 else None,
+        'p50_ms': round(float(percentiles[0]), 3),
+        'p95_ms': round(float(percentiles[1]), 3),
+        'p99_ms': round(float(percentiles[2]), 3),
+        'peak_memory_mb': round(peak, 2) if peak is not None else None
+    }
+
+def timed_calls(func, calls):
+    """
+    Calls func() 'calls' times and returns the latency of every call.
+    """
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def bench_fetch(urls, repeat):
+    """
+    Feed download and parsing (RssArticles_1.collect_feeds) against the fixture server.
+    """
+    def run():
+        results = RssArticles_1.collect_feeds(urls)
+        return [result['seconds'] for result in results]
+    posts = [article for result in RssArticles_1.collect_feeds(urls) for article in result['articles']]
+    return measure(run, len(posts), repeat), posts
+
+def bench_fetch_delayed(headings, repeat):
+    """
+    Download of feeds with FIXTURE_DELAYS response delays, one feed at a time
+    (as before RssArticles_1.collect_feeds) and concurrently.
+    Returns:
+        dict: 'serial' and 'concurrent' results.
+    """
+    def run(max_workers):
+        return [result['seconds'] for result in RssArticles_1.collect_feeds(urls, max_workers)]
+    with FixtureServer(headings, len(FIXTURE_DELAYS), delays=FIXTURE_DELAYS) as server:
+        urls = server.urls
+        return {
+            'serial': measure(lambda: run(1), len(urls), repeat),
+            'concurrent': measure(lambda: run(RssArticles_1.MAX_WORKERS), len(urls), repeat)
+        }
+
+def bench_shape(posts, scale, repeat):
+    """
+    Record shaping: RssFeedNewArticle_2.iter_texts and FullRSSList_1_2.iter_records.
+    """
+    posts = posts * scale
+    def run():
+        for _ in RssFeedNewArticle_2.iter_texts(posts):
+            pass
+        for _ in FullRSSList_1_2.iter_records(posts):
+            pass
+    return measure(run, len(posts), repeat)
+
+def bench_preprocess(data, repeat):
+    """
+    Headline normalization and stemming (MLModelMLC_3.preprocess_text).
+    """
+    return measure(lambda: MLModelMLC_3.preprocess_text(data.copy(), stemming=MLModelMLC_3.USE_STEMMING),
+                   len(data), repeat)
+
+def bench_train(data, repeat):
+    """
+    Model training on one hyperparameter candidate (MLModelMLC_3.train_model).
+    """
+    path = os.path.abspath(f"train_{len(data)}.csv")
+    data.to_csv(path, index=False)
+    param_grid = {key: values[:1] for key, values in MLModelMLC_3.PARAM_GRID.items()}
+    try:
+        return measure(lambda: MLModelMLC_3.train_model(path, param_grid, n_jobs=1), len(data),
+                       repeat, trace_memory=False)
+    finally:
+        os.remove(path)
+
+def bench_inference(data, model, repeat):
+    """
+    Classification and validation of ArticleBatch chunks (MLModelReturns_4).
+    """
+    def run():
+        latencies = []
+        for chunk in MLModelReturns_4.chunked(article_records(data), MLModelReturns_4.CHUNK_SIZE):
+            start = time.perf_counter()
+            batch = ArticleBatch.from_records(chunk)
+            MLModelReturns_4.classify_chunk(batch, model['vectorizer'], model['best_clf_pipeline'],
+                                            model['categories'], model['normalizer'])
+            MLModelReturns_4.validate_chunk(batch)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+    return measure(run, len(data), repeat)
+
+def bench_insert(data, categories, repeat):
+    """
+    Duplicate check and insertion with aggregates (DbTransfer_5.insert_data) into fresh SQLite files.
+    Returns:
+        tuple: (result, path of the last database file)
+    """
+    runs = iter(range(repeat + 2))
+    paths = []
+
+    def run():
+        path = os.path.abspath(f"insert_{len(data)}_{next(runs)}.db")
+        paths.append(path)
+        storage = DbTransfer_5.db_connection(f"sqlite:///{path}")
+        latencies = []
+        for batch in labeled_batches(data, categories):
+            start = time.perf_counter()
+            DbTransfer_5.insert_data(batch, storage, None)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+    return measure(run, len(data), repeat), paths[-1]
+
+def bench_dashboard(db_path):
+    """
+    Latency of every dashboard data function on a filled database.
+    """
+    storage = Storage.get_storage(f"sqlite:///{db_path}")
+    start_date, end_date = datetime.date(2025, 2, 1), datetime.date(2025, 2, 14)
+    all_articles = DashboardData.NewsQuery(storage)
+    filtered = DashboardData.NewsQuery(storage, "Politik", start_date, end_date)
+    search = DashboardData.NewsQuery(storage, "Alla", start_date, end_date, "regeringen")
+    total = DashboardData.count_articles(storage, all_articles)[0]
+    deep_page = max(1, total // DashboardData.PAGE_SIZE // 2)
+    queries = {
+        'count_all': lambda: DashboardData.count_articles(storage, all_articles),
+        'count_filtered': lambda: DashboardData.count_articles(storage, filtered),
+        'count_search': lambda: DashboardData.count_articles(storage, search),
+        'page_first': lambda: DashboardData.fetch_page(storage, filtered, 1),
+        'page_deep': lambda: DashboardData.fetch_page(storage, all_articles, deep_page),
+        'page_search': lambda: DashboardData.fetch_page(storage, search, 1),
+        'category_totals': lambda: DashboardData.category_totals(storage, "Politik", start_date, end_date),
+        'daily_totals': lambda: DashboardData.daily_totals(storage, "Alla", start_date, end_date),
+        'word_frequencies': lambda: DashboardData.word_frequencies(storage, "Alla", start_date, end_date),
+    }
+    return {name: measure(lambda query=query: timed_calls(query, QUERY_REPEAT), QUERY_REPEAT, 1)
+            for name, query in queries.items()}
+
+def train_reference_model(data):
+    """
+    Trains the model used by the inference benchmark on the unscaled data.
+    """
+    path = os.path.abspath("reference.csv")
+    data.to_csv(path, index=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        vectorizer, best_clf_pipeline, categories, _, _, _ = MLModelMLC_3.train_model(path)
+    return {
+        'categories': categories,
+        'vectorizer': vectorizer,
+        'best_clf_pipeline': MLModelReturns_4.fused_scorer(best_clf_pipeline),  # As MLModelReturns_4.load_model()
+        'normalizer': MLModelMLC_3.make_normalizer(MLModelMLC_3.USE_STEMMING)
+    }
+
+def parity_models(data):
+    """
+    Trains the models the fused scorer is checked against: the TF-IDF model,
+    its compact version (ModelCompaction.py) and an incremental PerLabelNB.
+    Returns:
+        dict: Name -> (vectorizer, classifier with predict_proba)
+    """
+    import ModelCompaction
+
+    path = os.path.abspath("parity.csv")
+    data.to_csv(path, index=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        vectorizer, best_clf_pipeline, categories, _, _, document_frequencies = MLModelMLC_3.train_model(path)
+        compact = ModelCompaction.compact_artifact({'vectorizer': vectorizer, 'best_clf_pipeline': best_clf_pipeline,
+                                                    'categories': categories}, document_frequencies)
+        hashing = MLModelMLC_3.hashing_vectorizer()
+        texts = MLModelMLC_3.make_normalizer(MLModelMLC_3.USE_STEMMING).normalize_batch(data['Heading'].astype(str))
+        incremental = MLModelMLC_3.PerLabelNB(len(categories), alpha=0.21).partial_fit(
+            hashing.transform(texts), data[categories].to_numpy())
+    return {
+        'tfidf': (vectorizer, best_clf_pipeline),
+        'compact': (compact['vectorizer'], compact['best_clf_pipeline']),
+        'incremental': (hashing, incremental)
+    }
+
+def median_seconds(func, repeat):
+    return float(np.median(timed_calls(func, repeat)))
+
+def check_fused(repeat=REPEAT):
+    """
+    Compares MLModelReturns_4.FusedScorer with predict_proba of every model on
+    the normalized Book1.csv headlines, then times both scorers on vectorized
+    batches of PARITY_BATCH_SIZES and, for the TF-IDF model, with the
+    categories repeated to PARITY_LABEL_COUNTS labels.
+    Returns:
+        list: Descriptions of the models whose probabilities differ.
+    """
+    data = load_data()
+    failures = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="parity_") as workdir:
+        os.chdir(workdir)
+        stem_cache_path, TextNormalizer.STEM_CACHE_PATH = TextNormalizer.STEM_CACHE_PATH, \
+            os.path.join(workdir, "stem_cache.json")  # Not the project's cache
+        try:
+            models = parity_models(data)
+            scaled = scale_data(data, -(-max(PARITY_BATCH_SIZES) // len(data)))
+            with contextlib.redirect_stdout(io.StringIO()):
+                texts = MLModelMLC_3.preprocess_text(scaled, stemming=MLModelMLC_3.USE_STEMMING)['Heading'].tolist()
+        finally:
+            os.chdir(cwd)
+            TextNormalizer.STEM_CACHE_PATH = stem_cache_path
+
+    print(f"\n{'model':<12} {'max difference':>15} {'label changes':>14}")
+    for name, (vectorizer, classifier) in models.items():
+        x = vectorizer.transform(texts)
+        expected = classifier.predict_proba(x)
+        scorer = MLModelReturns_4.fused_scorer(classifier)
+        if not isinstance(scorer, MLModelReturns_4.FusedScorer):
+            failures.append(f"{name} could not be fused")
+            continue
+        actual = scorer.predict_proba(x)
+        difference = float(np.abs(actual - expected).max())
+        tolerance = PARITY_TOLERANCE if scorer.weights.dtype == np.float64 else PARITY_TOLERANCE_FLOAT32
+        changes = int(((actual >= MLModelReturns_4.THRESHOLD) != (expected >= MLModelReturns_4.THRESHOLD)).sum())
+        print(f"{name:<12} {difference:>15.2e} {changes:>14}")
+        if not difference <= tolerance:
+            failures.append(f"{name} differs by {difference:.2e}")
+
+    print(f"\n{'model':<12} {'labels':>7} {'batch':>7} {'per estimator':>15} {'fused':>15} {'speedup':>8}")
+    timings = [(name, vectorizer, classifier, len(classifier_estimators(classifier)), batch_size)
+               for name, (vectorizer, classifier) in models.items() for batch_size in PARITY_BATCH_SIZES]
+    vectorizer, classifier = models['tfidf']
+    for labels in PARITY_LABEL_COUNTS[1:]:
+        timings.append(("tfidf", vectorizer, repeat_labels(classifier, labels), labels, max(PARITY_BATCH_SIZES)))
+    for name, vectorizer, classifier, labels, batch_size in timings:
+        x = vectorizer.transform(texts[:batch_size])
+        scorer = MLModelReturns_4.fused_scorer(classifier)
+        before = median_seconds(lambda: classifier.predict_proba(x), repeat)
+        after = median_seconds(lambda: scorer.predict_proba(x), repeat)
+        print(f"{name:<12} {labels:>7} {batch_size:>7} {batch_size / before:>13.0f}/s {batch_size / after:>13.0f}/s "
+              f"{before / after:>7.1f}x")
+    return failures
+
+def classifier_estimators(classifier):
+    """
+    Returns the per-label estimators of a pipeline or PerLabelNB.
+    """
+    steps = getattr(classifier, "steps", None)
+    return (steps[-1][1] if steps else classifier).estimators_
+
+def repeat_labels(best_clf_pipeline, labels):
+    """
+    Returns a copy of the pipeline whose estimators are repeated up to 'labels' labels.
+    """
+    pipeline = copy.deepcopy(best_clf_pipeline)
+    classifier = pipeline.steps[-1][1]
+    estimators = classifier.estimators_
+    classifier.estimators_ = [estimators[label % len(estimators)] for label in range(labels)]
+    return pipeline
+
+def code_version():
+    """
+    Returns the git commit of the scripts, or "unknown".
+    """
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=SCRIPT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_benchmarks(scales=DEFAULT_SCALES, repeat=REPEAT, max_train_scale=MAX_TRAIN_SCALE, stages=None):
+    """
+    Runs the benchmark suite in a temporary working directory.
+    Args:
+        scales (iterable): Dataset scale factors.
+        repeat (int): Timed runs per stage.
+        max_train_scale (int): Largest scale the training stage runs at.
+        stages (set): Stage names to run (fetch, shape, preprocess, train,
+                      inference, insert, dashboard), all when None.
+    Returns:
+        dict: Metadata and one result per "stage@scale".
+    """
+    wanted = lambda stage: stages is None or stage in stages
+    data = load_data()
+    categories = list(data.columns.values)[2:]
+    results = {}
+
+    def report(name, result):
+        results[name] = result
+        peak = f"{result['peak_memory_mb']:>8.1f} MB" if result['peak_memory_mb'] is not None else "       -"
+        print(f"{name:<32} {result['items']:>9} items {result['items_per_second'] or 0:>12.1f}/s "
+              f"p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+              f"p99 {result['p99_ms']:>9.2f} ms  peak {peak}")
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as workdir:
+        os.chdir(workdir)
+        stem_cache_path, TextNormalizer.STEM_CACHE_PATH = TextNormalizer.STEM_CACHE_PATH, \
+            os.path.join(workdir, "stem_cache.json")  # Not the project's cache
+        try:
+            posts = []
+            if wanted("fetch") or wanted("shape"):
+                with FixtureServer(data['Heading'].astype(str).tolist()) as server:
+                    result, posts = bench_fetch(server.urls, repeat)
+                if wanted("fetch"):
+                    report("fetch", result)
+                    for mode, result in bench_fetch_delayed(data['Heading'].astype(str).tolist(), repeat).items():
+                        report(f"fetch_delayed.{mode}", result)
+
+            model = train_reference_model(data) if wanted("inference") else None
+
+            for scale in scales:
+                if wanted("shape"):
+                    report(f"shape@{scale}", bench_shape(posts, scale, repeat))
+                scaled = scale_data(data, scale)
+                if wanted("preprocess"):
+                    report(f"preprocess@{scale}", bench_preprocess(scaled, repeat))
+                if wanted("train") and scale <= max_train_scale:
+                    report(f"train@{scale}", bench_train(scaled, 1))
+                if wanted("inference"):
+                    report(f"inference@{scale}", bench_inference(scaled, model, repeat))
+                if wanted("insert") or wanted("dashboard"):
+                    result, db_path = bench_insert(scaled, categories, 1 if not wanted("insert") else repeat)
+                    if wanted("insert"):
+                        report(f"insert@{scale}", result)
+                    if wanted("dashboard"):
+                        for query, result in bench_dashboard(db_path).items():
+                            report(f"dashboard.{query}@{scale}", result)
+                del scaled
+        finally:
+            os.chdir(cwd)
+            TextNormalizer.STEM_CACHE_PATH = stem_cache_path
+
+    return {
+        'version': code_version(),
+        'created': datetime.datetime.now().isoformat(timespec="seconds"),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'results': results
+    }
+
+def import_profile(code, args=(), env=None):
+    """
+    Runs 'code' in a fresh interpreter with -X importtime.
+    Returns:
+        tuple: (names of the loaded modules, {top-level package: cumulative import seconds},
+                error message or None)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code, *args],
+                            env=env, capture_output=True, text=True, timeout=600)
+    modules = next((json.loads(line[len("MODULES "):]) for line in result.stdout.splitlines()
+                    if line.startswith("MODULES ")), [])
+    seconds, errors = {}, []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:"):
+            errors.append(line)
+        elif len(parts) == 3 and parts[1].strip().isdigit() and "." not in parts[2].strip():
+            seconds.setdefault(parts[2].strip(), int(parts[1]) / 1e6)  # Includes the submodules
+    error = None
+    if result.returncode != 0:
+        error = errors[-1] if errors else f"exit code {result.returncode}"
+    return modules, seconds, error
+
+def lazy_violations(modules, lazy_modules):
+    """
+    Returns the loaded modules that are, or belong to, one of 'lazy_modules'.
+    """
+    return sorted(name for name in modules
+                  if any(name == lazy or name.startswith(lazy + ".") for lazy in lazy_modules))
+
+def check_imports():
+    """
+    Checks that the pipeline reaches its first fetch, and the "Start" and
+    "Data" pages render, without loading the ML and plotting libraries.
+    Returns:
+        list: Descriptions of the modules that were loaded too early.
+    """
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="imports_") as workdir:
+        url = f"sqlite:///{os.path.join(workdir, 'artiklar.db')}"
+        with contextlib.redirect_stdout(io.StringIO()):
+            DbTransfer_5.db_connection(url)  # The dashboard expects the tables
+        env = dict(os.environ, ARTIKLAR_DB_URL=url, ARTIKLAR_METRICS="0",
+                   PYTHONPATH=os.pathsep.join(filter(None, [SCRIPT_DIR, os.environ.get("PYTHONPATH")])))
+        checks = [
+            ("pipeline", PIPELINE_PROBE, (), PIPELINE_LAZY_MODULES),
+            ("dashboard", DASHBOARD_PROBE, (os.path.join(SCRIPT_DIR, "streamlitapp1.py"), *DASHBOARD_PAGES),
+             DASHBOARD_LAZY_MODULES),
+        ]
+        cwd = os.getcwd()
+        os.chdir(workdir)  # Files the scripts write stay in the temporary directory
+        try:
+            for name, code, args, lazy_modules in checks:
+                modules, seconds, error = import_profile(code, args, env)
+                if error:
+                    failures.append(f"{name} failed: {error}")
+                slowest = sorted(seconds.items(), key=lambda item: -item[1])[:IMPORT_REPORT_SIZE]
+                print(f"\n{name}: {len(modules)} modules loaded, slowest imports:")
+                for package, elapsed in slowest:
+                    print(f"  {package:<30} {elapsed * 1000:>9.1f} ms")
+                violations = lazy_violations(modules, lazy_modules)
+                roots = sorted({module.split(".")[0] for module in violations})
+                if violations:
+                    failures.append(f"{name} loaded {', '.join(roots)}")
+                print(f"  lazy modules loaded: {', '.join(roots) if roots else 'none'}")
+        finally:
+            os.chdir(cwd)
+    return failures
+
+def check_feed_state():
+    """
+    Fetches the fixture feeds three times with a feed state file, the way
+    DbTransfer_5.main does: the first fetch stands for a run whose store
+    failed, so its state is not saved and the second fetch must download the
+    feeds again. After save() the third fetch must get a 304 for every feed.
+    Finally a feed that misses the deadline must not enter the saved state
+    when its download finishes later, so the next run still collects it.
+    Returns:
+        list: Descriptions of the failed checks.
+    """
+    data = load_data()
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="feed_state_") as workdir, \
+            FixtureServer(data['Heading'].astype(str).tolist(), feeds=3, items=5) as server:
+        urls = server.urls
+        state_path = os.path.join(workdir, "feed_state.json")
+
+        def fetch():
+            del server.statuses[:]
+            with contextlib.redirect_stdout(io.StringIO()):
+                state = RssArticles_1.main(urls, state_path=state_path)
+            statuses = [result['status'] for result in RssArticles_1.feed_results]
+            print(f"  HTTP {server.statuses}, feeds {statuses}, {len(RssArticles_1.posts)} articles")
+            return state, statuses
+
+        print("Fetch whose store fails:")
+        fetch()
+        if os.path.exists(state_path):
+            failures.append("the fetch saved the feed state before the articles were stored")
+        print("Fetch after the failed store:")
+        state, statuses = fetch()
+        if statuses != ['ok'] * len(urls) or not RssArticles_1.posts:
+            failures.append(f"the feeds were not fetched again after a failed store: {statuses}")
+        state.save()  # As after a successful store
+        print("Fetch after a successful store:")
+        _, statuses = fetch()
+        if server.statuses != [304] * len(urls) or statuses != ['not_modified'] * len(urls):
+            failures.append(f"unchanged feeds were not answered with 304: HTTP {server.statuses}, feeds {statuses}")
+        if RssArticles_1.posts:
+            failures.append("feeds answered with 304 returned articles")
+
+    with tempfile.TemporaryDirectory(prefix="feed_state_") as workdir, \
+            FixtureServer(data['Heading'].astype(str).tolist(), feeds=2, items=3, delays=[0, 2]) as server:
+        state_path = os.path.join(workdir, "feed_state.json")
+        print("Fetch where the slow feed misses the deadline:")
+        with contextlib.redirect_stdout(io.StringIO()):
+            state = RssArticles_1.main(server.urls, deadline=1, state_path=state_path)
+        print(f"  feeds {[result['status'] for result in RssArticles_1.feed_results]}")
+        time.sleep(2.5)  # The late download finishes in the background
+        state.save()
+        print("Fetch after the late feed finished:")
+        with contextlib.redirect_stdout(io.StringIO()):
+            RssArticles_1.main(server.urls, deadline=5, state_path=state_path)
+        statuses = [result['status'] for result in RssArticles_1.feed_results]
+        print(f"  feeds {statuses}, {len(RssArticles_1.posts)} articles")
+        if statuses[1] != 'ok':
+            failures.append(f"a feed that missed the deadline was skipped on the next run: {statuses}")
+    return failures
+
+def baseline_path(name):
+    return os.path.join(BENCHMARK_DIR, f"{name}.json")
+
+def save_baseline(report, name):
+    """
+    Saves benchmark results as benchmarks/<name>.json.
+    """
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    path = baseline_path(name)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+def compare(report, name, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compares the median latencies with a saved baseline.
+    Returns:
+        list: Names of the stages that got slower than the tolerance allows.
+    """
+    with open(baseline_path(name), encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with baseline '{name}' ({baseline.get('version')}, {baseline.get('created')}):")
+    regressions = []
+    for stage, result in report['results'].items():
+        before = baseline['results'].get(stage)
+        if not before or not before['p50_ms']:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms']
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(stage)
+            flag = "  REGRESSION"
+        print(f"{stage:<32} {before['p50_ms']:>9.2f} ms -> {result['p50_ms']:>9.2f} ms ({ratio - 1:+.0%}){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline and dashboard hot paths offline.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES), help="Book1.csv scale factors")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs per stage")
+    parser.add_argument("--max-train-scale", type=int, default=MAX_TRAIN_SCALE, help="largest scale to train at")
+    parser.add_argument("--stages", nargs="+", default=None,
+                        help="only these stages (fetch shape preprocess train inference insert dashboard)")
+    parser.add_argument("--save", metavar="NAME", help="save the results as benchmarks/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare with benchmarks/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="allowed slowdown before a stage counts as a regression")
+    parser.add_argument("--imports", action="store_true",
+                        help="only check that startup does not load the ML and plotting libraries")
+    parser.add_argument("--parity", action="store_true",
+                        help="only check the fused scorer against predict_proba and time both")
+    parser.add_argument("--feed-state", action="store_true",
+                        help="only check that the feed state is saved after storing and gives 304 responses")
+    args = parser.parse_args()
+
+    print('-----Starting Benchmark.py-----')
+    if args.imports:
+        failures = check_imports()
+        if failures:
+            print(f"\nImport regressions: {'; '.join(failures)}")
+            sys.exit(1)
+        print("\nNo import regressions.")
+        return
+    if args.feed_state:
+        failures = check_feed_state()
+        if failures:
+            print(f"\nFeed state failures: {'; '.join(failures)}")
+            sys.exit(1)
+        print("\nThe feed state is saved after storing and unchanged feeds get 304.")
+        return
+    if args.parity:
+        failures = check_fused(args.repeat)
+        if failures:
+            print(f"\nParity failures: {'; '.join(failures)}")
+            sys.exit(1)
+        print("\nThe fused scorer matches predict_proba.")
+        return
+    report = run_benchmarks(args.scales, args.repeat, args.max_train_scale,
+                            set(args.stages) if args.stages else None)
+    if args.save:
+        print(f"Saved results to {save_baseline(report, args.save)}.")
+    if args.compare:
+        regressions = compare(report, args.compare, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions.")
+
+if __name__ == "__main__":
+    main()
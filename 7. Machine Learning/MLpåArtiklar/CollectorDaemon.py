@@ -0,0 +1,152 @@
+# Description: Long-running collector that replaces running DbTransfer_5.py
+# from cron. The model is loaded once and kept warm in the process; the feeds
+# are polled on a fixed schedule with random jitter, every cycle streams its
+# articles through classification into the database, and all per-cycle data is
+# released afterwards so memory does not grow between cycles. The feed state is
+# saved only when every batch of the cycle was stored.
+# Stop it with Ctrl+C or SIGTERM; the running cycle is finished first.
+#
+# Usage: python CollectorDaemon.py [--interval SECONDS] [--jitter FRACTION] [--cycles N]
+
+import argparse
+import collections
+import gc
+import random
+import signal
+import threading
+import time
+
+import RssArticles_1
+import MLModelReturns_4
+import DbTransfer_5
+import Instrumentation
+
+# Seconds between the start of two cycles
+POLL_INTERVAL = 3600
+
+# Random variation of the interval, as a fraction of POLL_INTERVAL
+JITTER = 0.1
+
+# Number of cycle reports kept in memory
+HISTORY_SIZE = 100
+
+class CollectorDaemon:
+    """
+    Polls the RSS feeds on a schedule and stores classified articles.
+    Args:
+        storage (Storage): The database storage.
+        interval (float): Seconds between the start of two cycles.
+        jitter (float): Random variation of the interval as a fraction of it.
+        chunk_size (int): Number of records classified and inserted together.
+    """
+
+    def __init__(self, storage, interval=POLL_INTERVAL, jitter=JITTER,
+                 chunk_size=MLModelReturns_4.CHUNK_SIZE):
+        self.storage = storage
+        self.interval = interval
+        self.jitter = jitter
+        self.chunk_size = chunk_size
+        self.stop_event = threading.Event()
+        self.history = collections.deque(maxlen=HISTORY_SIZE)  # Latest cycle reports
+        self.cycle_count = 0
+        self.model = None
+        self.bloom = None
+
+    def start(self):
+        """
+        Loads the model and warms the Bloom filter of stored links once.
+        """
+        self.model = MLModelReturns_4.load_model()
+        self.bloom = DbTransfer_5.warm_bloom_filter(self.storage)
+
+    @Instrumentation.instrument("cycle")
+    def run_cycle(self):
+        """
+        Runs one fetch -> classify -> store cycle.
+        Returns:
+            dict: Cycle report with latency, article counts and the process peak RSS.
+        """
+        start = time.perf_counter()
+        feed_state = RssArticles_1.main()
+        fetched = len(RssArticles_1.posts)
+        Instrumentation.count(fetched)
+
+        batches = MLModelReturns_4.iter_batches(RssArticles_1.posts, self.chunk_size, self.model)
+        classified, inserted, failed = DbTransfer_5.insert_batches(batches, self.storage, self.bloom)
+        if failed:
+            print(f"{failed} batches could not be stored; the feeds are fetched again in the next cycle.")
+        elif feed_state:
+            feed_state.save()
+
+        # Release everything the cycle allocated before sleeping
+        RssArticles_1.posts.clear()
+        gc.collect()
+
+        self.cycle_count += 1
+        report = {
+            'cycle': self.cycle_count,
+            'started': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'seconds': round(time.perf_counter() - start, 3),
+            'feeds': len(RssArticles_1.feed_results),
+            'skipped_feeds': RssArticles_1.skipped_feeds,
+            'fetched': fetched,
+            'classified': classified,
+            'inserted': inserted,
+            'failed_batches': failed,
+            'peak_rss_mb': Instrumentation.process_peak_rss_mb()
+        }
+        self.history.append(report)
+        print(f"Cycle {report['cycle']}: {report['seconds']}s, {fetched} fetched, "
+              f"{classified} classified, {inserted} inserted, process peak RSS {report['peak_rss_mb']} MB")
+        return report
+
+    def next_delay(self):
+        """
+        Returns the delay until the next cycle, with jitter applied.
+        """
+        return max(0.0, self.interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def stop(self, *args):
+        """
+        Asks the daemon to stop after the running cycle (usable as a signal handler).
+        """
+        print("Stopping collector after the current cycle...")
+        self.stop_event.set()
+
+    def run(self, max_cycles=None):
+        """
+        Runs cycles until stopped or until 'max_cycles' cycles have completed.
+        """
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        self.start()
+
+        cycles = 0
+        while not self.stop_event.is_set():
+            cycle_start = time.monotonic()
+            try:
+                self.run_cycle()
+            except Exception as e:  # Keep the daemon alive; the next cycle retries
+                print(f"Cycle failed: {e}")
+            cycles += 1
+            if max_cycles is not None and cycles >= max_cycles:
+                break
+            self.stop_event.wait(max(0.0, self.next_delay() - (time.monotonic() - cycle_start)))
+        print("Collector stopped.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect, classify and store RSS articles on a schedule.")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="seconds between cycles")
+    parser.add_argument("--jitter", type=float, default=JITTER, help="random variation as a fraction of the interval")
+    parser.add_argument("--cycles", type=int, default=None, help="stop after this many cycles")
+    args = parser.parse_args()
+
+    print('-----Starting CollectorDaemon.py-----')
+    storage = DbTransfer_5.db_connection()
+    if not storage:
+        print("No database connection could be established.")
+        return
+    CollectorDaemon(storage, args.interval, args.jitter).run(args.cycles)
+
+if __name__ == "__main__":
+    main()
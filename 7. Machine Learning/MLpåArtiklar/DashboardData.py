@@ -0,0 +1,213 @@
+# Description: Data layer for the Streamlit dashboard (streamlitapp1.py).
+# NewsQuery turns the sidebar filters into parameterized SQL, so the "Data"
+# page and the KPI cards read one page and one COUNT from the database (using
+# the indexes in Storage.NEWS_INDEXES) and no page loads the whole table.
+# Keyword searches go through the full-text index and are ranked by relevance.
+# The word cloud reads pre-aggregated title word counts (Aggregates.TokenCounts)
+# and the charts read the daily rollup (Aggregates.DailyCounts), so the
+# "Analys" page costs O(days x categories) instead of O(articles).
+# streamlitapp1.py caches every result per filter combination for REFRESH_TTL
+# seconds across sessions, so the database load does not grow with the number
+# of dashboard users.
+import datetime
+
+import pandas as pd
+
+import Storage
+
+# Seconds the dashboard caches query results and rendered images
+REFRESH_TTL = 60
+
+# Rows per page on the "Data" page
+PAGE_SIZE = 100
+
+# Number of most frequent words read for the word cloud
+WORDCLOUD_TOKENS = 200
+
+# Cleaning up the naming structure within the dataframe to present it in a more user-friendly way
+COLUMN_RENAME_MAP = {
+    "id": "Index",
+    "title": "Titel",
+    "summary": "Summering",
+    "link": "Länk",
+    "published": "Publicerad",
+    "topic": "Ämne",
+    "politik": "Politik",
+    "utbildning": "Utbildning",
+    "religion": "Religion",
+    "miljo": "Miljö",
+    "ekonomi": "Ekonomi",
+    "livsstilfritt": "Fritid & Nöje",
+    "samhallekonflikter": "Samhälle & Konflikter",
+    "halsa": "Hälsa",
+    "idrott": "Idrott",
+    "vetenskapteknik": "Vetenskap & Teknik"
+}
+
+# Dashboard category name -> flag column in the 'news' table
+CATEGORY_FILTERS = {COLUMN_RENAME_MAP[column]: column for column in Storage.CATEGORY_COLUMNS.values()}
+
+def prepare_frame(df):
+    """
+    Renames the columns and adds the parsed "Publicerad" and "Datum" columns.
+    Args:
+        df (DataFrame): Rows from the 'news' table indexed by id.
+    Returns:
+        DataFrame: The dashboard version of the rows.
+    """
+    df = df.rename(columns=COLUMN_RENAME_MAP)
+    # creates "Datum" column from "Publicerad" column to ensure we can filter by date properly
+    if "Publicerad" in df.columns:
+        df["Publicerad"] = pd.to_datetime(df["Publicerad"], errors="coerce")
+        df["Datum"] = df["Publicerad"].dt.date
+    return df
+
+class NewsQuery:
+    """
+    Parameterized SQL for the dashboard filters.
+    Args:
+        storage (Storage): The storage the query runs on (placeholder and search dialect).
+        category (str): Dashboard category name, or "Alla" for all categories.
+        start_date, end_date (date): Inclusive publication date range, or None.
+        search_query (str): Keywords that must appear in the title or summary;
+                            the last word may be the beginning of a word.
+    """
+
+    def __init__(self, storage, category="Alla", start_date=None, end_date=None, search_query=""):
+        self.storage = storage
+        self.category = category
+        self.start_date = start_date
+        self.end_date = end_date
+        self.search = storage.search_expression(search_query) if search_query else ""
+
+    def where(self):
+        """
+        Returns the FROM and WHERE clauses (WHERE empty without filters) and their parameters.
+        """
+        p = self.storage.placeholder
+        clauses, params = [], []
+        if self.category and self.category != "Alla":
+            clauses.append(f"news.{CATEGORY_FILTERS[self.category]} = 1")  # Column names come from the whitelist
+        if self.start_date:
+            clauses.append(f"news.published >= {p}")
+            params.append(f"{self.start_date:%Y-%m-%d} 00:00:00")
+        if self.end_date:
+            clauses.append(f"news.published < {p}")
+            params.append(f"{self.end_date + datetime.timedelta(days=1):%Y-%m-%d} 00:00:00")
+        if self.search:
+            clauses.append(self.storage.search_condition)  # Full-text index lookup
+            params.append(self.search)
+        source = self.storage.search_from if self.search else "news"
+        return f"{source}" + (" WHERE " + " AND ".join(clauses) if clauses else ""), tuple(params)
+
+    def count_sql(self):
+        """
+        Returns the KPI query: number of articles and number of articles with a topic.
+        """
+        where, params = self.where()
+        return (f"SELECT COUNT(*), COALESCE(SUM(CASE WHEN news.topic <> '' THEN 1 ELSE 0 END), 0) FROM {where}",
+                params)
+
+    def page_sql(self, page, page_size=PAGE_SIZE):
+        """
+        Returns the query for one page (numbered from 1): the best search
+        matches first when searching, otherwise the newest articles first.
+        """
+        where, params = self.where()
+        p = self.storage.placeholder
+        order = "news.published DESC, news.id DESC"
+        if self.search:
+            rank = self.storage.search_rank
+            order = f"{rank}, {order}"
+            params += (self.search,) * rank.count(p)
+        return (f"SELECT news.* FROM {where} ORDER BY {order} LIMIT {p} OFFSET {p}",
+                params + (page_size, (max(page, 1) - 1) * page_size))
+
+def count_articles(storage, query):
+    """
+    Counts the articles matching the filters.
+    Returns:
+        tuple: (number of articles, number of articles with a topic)
+    """
+    sql, params = query.count_sql()
+    with storage.connection() as cnxn:
+        cursor = cnxn.cursor()
+        try:
+            cursor.execute(sql, params)
+            total, with_topic = cursor.fetchone()
+        finally:
+            cursor.close()
+    return int(total), int(with_topic)
+
+def fetch_page(storage, query, page, page_size=PAGE_SIZE):
+    """
+    Reads one page of matching articles, prepared for display.
+    """
+    sql, params = query.page_sql(page, page_size)
+    return prepare_frame(storage.read_frame(sql, params, index_col="id"))
+
+def _rollup_filter(storage, category, start_date, end_date):
+    """
+    Returns the WHERE clause and parameters for daily_counts and token_counts.
+    """
+    p = storage.placeholder
+    category = CATEGORY_FILTERS[category] if category and category != "Alla" else "alla"
+    clauses, params = [f"category = {p}"], [category]
+    if start_date:
+        clauses.append(f"day >= {p}")
+        params.append(f"{start_date:%Y-%m-%d}")
+    if end_date:
+        clauses.append(f"day <= {p}")
+        params.append(f"{end_date:%Y-%m-%d}")
+    return " AND ".join(clauses), params
+
+def category_totals(storage, category="Alla", start_date=None, end_date=None):
+    """
+    Counts the selected articles per category from the daily rollup.
+    Returns:
+        DataFrame: Columns "Kategori" and "Antal Artiklar", one row per category.
+    """
+    where, params = _rollup_filter(storage, category, start_date, end_date)
+    columns = list(CATEGORY_FILTERS.values())
+    df = storage.read_frame(
+        f"SELECT {', '.join(f'COALESCE(SUM({column}), 0) AS {column}' for column in columns)} "
+        f"FROM daily_counts WHERE {where}", tuple(params)
+    )
+    return pd.DataFrame({
+        "Kategori": list(CATEGORY_FILTERS),
+        "Antal Artiklar": [int(df[column].iloc[0]) for column in columns]
+    })
+
+def daily_totals(storage, category="Alla", start_date=None, end_date=None):
+    """
+    Counts the selected articles per publication day from the daily rollup.
+    Returns:
+        DataFrame: Columns "Datum" and "Antal Artiklar", ordered by day.
+    """
+    where, params = _rollup_filter(storage, category, start_date, end_date)
+    df = storage.read_frame(
+        f"SELECT day, SUM(articles) AS articles FROM daily_counts WHERE {where} GROUP BY day ORDER BY day",
+        tuple(params)
+    )
+    return pd.DataFrame({
+        "Datum": pd.to_datetime(df["day"]).dt.date if len(df) else [],
+        "Antal Artiklar": df["articles"].astype(int) if len(df) else []
+    })
+
+def word_frequencies(storage, category="Alla", start_date=None, end_date=None, limit=WORDCLOUD_TOKENS):
+    """
+    Sums the title word counts of the selected category and date range.
+    The query reads token_counts only, so it does not depend on the number of articles.
+    Returns:
+        dict: Word -> number of occurrences, the 'limit' most frequent words.
+    """
+    where, params = _rollup_filter(storage, category, start_date, end_date)
+    sql = (f"SELECT token, SUM(occurrences) AS total FROM token_counts WHERE {where} "
+           f"GROUP BY token ORDER BY total DESC, token LIMIT {storage.placeholder}")
+    with storage.connection() as cnxn:
+        cursor = cnxn.cursor()
+        try:
+            cursor.execute(sql, (*params, limit))
+            return {token: int(total) for token, total in cursor.fetchall()}
+        finally:
+            cursor.close()
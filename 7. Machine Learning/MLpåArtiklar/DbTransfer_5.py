@@ -1,106 +1,170 @@
 # Description: This script is responsible for transferring the processed data 
-# from MLModelReturns_4 to the MySQL database.
+# from MLModelReturns_4 to the database (MySQL, or SQLite for local runs).
+# Duplicates are detected for a whole batch at once with chunked IN queries,
+# optionally pre-filtered by an in-process Bloom filter of known links, and the
+# insert itself is an idempotent upsert on the unique link key (see Storage.py).
+# The feed state (ETag, Last-Modified) is saved only after every batch has been
+# stored; after a failed insert the next run fetches the same feeds again.
 
+import hashlib
+import math
+import RssArticles_1
 import MLModelReturns_4
-import mysql.connector
+import Storage
+import Aggregates
+import Instrumentation
+from ArticleBatch import ArticleBatch
 
+# Warm a Bloom filter of all stored links at startup. Only links the filter
+# reports as possibly known are checked against the database.
+USE_BLOOM_FILTER = False
 
-def db_connection():
+
+def db_connection(url=None):
     """
-    Establishes a connection to the MySQL database.
+    Connects to the database and makes sure the 'news' table and the
+    aggregate tables (updated on every insert) exist.
+    Args:
+        url (str): Database URL, defaults to Storage.DATABASE_URL (ARTIKLAR_DB_URL).
     Returns:
-        connection: MySQL database connection object.
+        Storage: Pooled storage object, or None if the connection failed.
     """
     try:
-        cnxn = mysql.connector.connect(
-            host="localhost",  # Hostname
-            user="root",       # Username
-            password="dinmamma",  # Password
-            database="ArtiklarDB"  # Database name
-        )
+        storage = Storage.get_storage(url)
+        storage.aggregates = Aggregates.AGGREGATES
+        storage.ensure_schema()
         print("Connected to the database.")
-        return cnxn
-    except mysql.connector.Error as err:
+        return storage
+    except Exception as err:
         print(f"Database connection error: {err}")
         return None
 
-def article_exists(link, cnxn):
+class LinkBloomFilter:
     """
-    Checks if an article already exists in the database using its link.
+    Bloom filter of article links. A negative answer means the link is
+    certainly not stored; a positive answer has to be confirmed in the database.
     Args:
-        link (str): The article link to check.
-        cnxn: MySQL database connection object.
+        capacity (int): Expected number of links.
+        error_rate (float): Target false positive rate at full capacity.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, link):
+        digest = hashlib.blake2b(link.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, link):
+        for position in self._positions(link):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, link):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(link))
+
+def warm_bloom_filter(storage, capacity=1000000):
+    """
+    Builds a Bloom filter from all links stored in the 'news' table.
+    Args:
+        storage (Storage): The database storage.
+        capacity (int): Expected number of links.
     Returns:
-        bool: True if the article exists, False otherwise.
+        LinkBloomFilter: The warmed filter.
     """
-    cursor = cnxn.cursor()
-    query = "SELECT COUNT(*) FROM news WHERE link = %s"
-    cursor.execute(query, (link,))
-    result = cursor.fetchone()
-    cursor.close()
-    return result[0] > 0
-
-def insert_data(data, cnxn):
+    bloom = LinkBloomFilter(capacity)
+    for link in storage.iter_links():
+        bloom.add(link)
+    return bloom
+
+@Instrumentation.instrument("insert")
+def insert_data(data, storage, bloom=None, raise_errors=False):
     """
     Inserts new articles into the 'news' table while avoiding duplicates.
+    Existing links are looked up for the whole batch at once, so a batch costs
+    a few round trips instead of one query per article. The remaining rows are
+    upserted in chunks inside one transaction.
     Args:
-        data (list): List of dictionaries representing articles.
-        cnxn: MySQL database connection object.
-    """
-    cursor = cnxn.cursor()
-    insert_sql = """
-    INSERT INTO news (
-        title, summary, link, published, topic, politik, utbildning, religion,
-        miljo, ekonomi, livsstilfritt, samhallekonflikter, halsa, idrott, vetenskapteknik
-    )
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        data (ArticleBatch): The articles; a list of article dictionaries is
+                             converted to a batch first.
+        storage (Storage): The database storage.
+        bloom (LinkBloomFilter): Optional filter of known links; links it does
+                                 not contain are not looked up in the database.
+        raise_errors (bool): Re-raise database errors instead of printing them.
+    Returns:
+        int: Number of rows added.
     """
-    
-    data_tuples = []
-    for item in data:
-        if not article_exists(item['link'], cnxn):  # Check if the article already exists
-            categories = item['topic']
-            topic_string = ",".join(categories)  # Convert the list to a comma-separated string
-            data_tuples.append((
-                item['title'], item['summary'], item['link'], item['published'], topic_string,
-                1 if 'Politik' in categories else 0,
-                1 if 'Utbildning' in categories else 0,
-                1 if 'Religion' in categories else 0,
-                1 if 'Miljo' in categories else 0,
-                1 if 'Ekonomi' in categories else 0,
-                1 if 'LivsstilFritt' in categories else 0,
-                1 if 'SamhalleKonflikter' in categories else 0,
-                1 if 'Halsa' in categories else 0,
-                1 if 'Idrott' in categories else 0,
-                1 if 'VetenskapTeknik' in categories else 0
-            ))
+    if not isinstance(data, ArticleBatch):
+        data = ArticleBatch.from_records(data, list(Storage.CATEGORY_COLUMNS))
+
+    Instrumentation.count(len(data))
+    links = data.link
+    candidates = [link for link in links if link in bloom] if bloom is not None else links
+    known_links = storage.existing_links(candidates)
 
+    new_rows = []
+    for row, link in enumerate(links):
+        if link not in known_links:  # Check if the article already exists
+            known_links.add(link)  # Also skip duplicates within the batch
+            new_rows.append(row)
+    # Parameter tuples are built straight from the batch columns and label matrix
+    data_tuples = data.param_tuples(Storage.CATEGORY_COLUMNS, new_rows)
+
+    inserted = 0
     try:
         if data_tuples:  # Check if there are new articles to add
-            cursor.executemany(insert_sql, data_tuples)
-            cnxn.commit()
-            print(f"{cursor.rowcount} new rows added to the database.")
+            inserted = storage.upsert_articles(data_tuples)
+            print(f"{inserted} new rows added to the database.")
+            if bloom is not None:
+                for row in data_tuples:
+                    bloom.add(row[2])
         else:
             print("No new articles to add.")
-    except mysql.connector.Error as err:
+    except storage.Error as err:
+        if raise_errors:
+            raise
         print(f"Error inserting data: {err}")
-    finally:
-        cursor.close()
+    return inserted
+
+def insert_batches(batches, storage, bloom=None):
+    """
+    Inserts every batch, continuing after a batch that fails.
+    Args:
+        batches (iterable): ArticleBatch chunks, e.g. from MLModelReturns_4.iter_batches().
+        storage (Storage): The database storage.
+        bloom (LinkBloomFilter): Optional filter of known links.
+    Returns:
+        tuple: (number of articles, number of rows added, number of batches that failed)
+    """
+    articles = inserted = failed = 0
+    for batch in batches:
+        articles += len(batch)
+        try:
+            inserted += insert_data(batch, storage, bloom, raise_errors=True)
+        except storage.Error as err:
+            print(f"Error inserting data: {err}")
+            failed += 1
+    return articles, inserted, failed
 
 def main():
     """
     Main function to handle database operations.
     """
-    MLModelReturns_4.main()  # Ensure MLModelReturns_4 is run first
-    validDict = MLModelReturns_4.validDict  # Retrieve processed data from MLModelReturns_4
-
     print('-----Starting DbTransfer_5.py-----')
     # Connect to the database
-    cnxn = db_connection()
-    if cnxn:
-        # Insert new data into the database
-        insert_data(validDict, cnxn)
-        cnxn.close()
+    storage = db_connection()
+    if storage:
+        bloom = warm_bloom_filter(storage) if USE_BLOOM_FILTER else None
+        feed_state = RssArticles_1.main() # Fetch the RSS feeds
+        # Insert the processed data chunk by chunk as MLModelReturns_4 streams it
+        _, _, failed = insert_batches(MLModelReturns_4.iter_batches(RssArticles_1.posts), storage, bloom)
+        if failed:
+            print(f"{failed} batches could not be stored; the feeds are fetched again on the next run.")
+        elif feed_state:
+            feed_state.save()
         print("Database operations completed.")
     else:
         print("No database connection could be established.")
@@ -0,0 +1,87 @@
+# Description: Persistent per-feed HTTP state used by RssArticles_1.
+# For every feed URL it remembers the ETag, the Last-Modified header and a hash
+# of the last downloaded body, so unchanged feeds can be skipped without parsing.
+import hashlib
+import json
+import os
+import threading
+
+# Default location of the state file (next to the scripts, whatever the working directory)
+STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feed_state.json")
+
+def content_hash(body):
+    """
+    Returns the SHA-256 hex digest of a downloaded feed body.
+    """
+    return hashlib.sha256(body).hexdigest()
+
+class FeedStateCache:
+    """
+    Stores ETag, Last-Modified and content hash per feed URL in a JSON file.
+    The cache is shared by the fetch threads, so all updates go through a lock.
+    """
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Could not read feed state from {self.path}, starting empty: {e}")
+            return {}
+
+    def request_headers(self, url):
+        """
+        Builds the conditional request headers for a feed.
+        Args:
+            url (str): The feed URL.
+        Returns:
+            dict: 'If-None-Match' and/or 'If-Modified-Since' when known, else empty.
+        """
+        with self._lock:
+            entry = self._state.get(url, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def is_unchanged(self, url, digest):
+        """
+        Checks whether a downloaded body is identical to the previous one.
+        """
+        with self._lock:
+            return self._state.get(url, {}).get("content_hash") == digest
+
+    def update(self, url, headers, digest):
+        """
+        Remembers the validators and content hash of a successfully fetched feed.
+        Args:
+            url (str): The feed URL.
+            headers (dict): Lower-cased response headers.
+            digest (str): Content hash of the body.
+        """
+        with self._lock:
+            self._state[url] = {
+                "etag": headers.get("etag"),
+                "last_modified": headers.get("last-modified"),
+                "content_hash": digest
+            }
+
+    def save(self):
+        """
+        Writes the state to disk atomically (temporary file + rename).
+        """
+        with self._lock:
+            data = json.dumps(self._state, indent=2, ensure_ascii=False)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
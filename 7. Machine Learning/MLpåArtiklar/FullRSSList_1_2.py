@@ -1,35 +1,133 @@
 # Description: This script extracts necessary fields 
 # (title, summary, link, published) from posts and returns a list of dictionaries.
+# iter_records() does this lazily in a single pass, so records can stream
+# through classification and into the database in bounded chunks.
+# Dates are normalized by DateNormalizer: feedparser's parsed time tuples are
+# used when available, otherwise the format that last worked for the same feed
+# (or, for feeds no DATE_FORMATS entry matches, the fallback parsers) is tried
+# first, and format_dates_bulk() converts whole columns at once.
+# pandas is only imported by the bulk and last-resort parsers that need it.
 import RssArticles_1 
-from datetime import datetime
-import pandas as pd
+import calendar
+import email.utils
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-def gettingNecessaryList(posts):
+OUTPUT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# All dates are stored as local time in this time zone. Without a time zone
+# database (Windows without the tzdata package) the first date conversion
+# fails instead of storing UTC, so the stored times never depend on the platform.
+OUTPUT_TIMEZONE = "Europe/Stockholm"
+
+_output_timezone = None
+
+DATE_FORMATS = [
+    "%a, %d %b %Y %H:%M:%S %z",  # Example: "Mon, 05 Feb 2025 13:00:00 +0000"
+    "%a, %d %b %Y %H:%M:%S GMT",  # Example: "Mon, 05 Feb 2025 13:00:00 GMT"
+    "%Y-%m-%dT%H:%M:%S%z",        # Example: "2025-02-05T13:00:00+0000"
+    "%Y-%m-%dT%H:%M:%S.%f%z",     # Example: "2025-02-05T13:00:00.000+01:00"
+    "%a, %d %b %Y %H:%M %z",      # Example: "Mon, 05 Feb 2025 13:00 +0100"
+]
+
+def output_timezone():
     """
-    Extracts necessary fields (title, summary, link, published) from posts
-    and returns a list of dictionaries.
+    Returns OUTPUT_TIMEZONE, loaded on first use.
+    Raises:
+        RuntimeError: If there is no time zone data for it.
+    """
+    global _output_timezone
+    if _output_timezone is None:
+        try:
+            _output_timezone = ZoneInfo(OUTPUT_TIMEZONE)
+        except ZoneInfoNotFoundError as e:
+            raise RuntimeError(f"No time zone data for {OUTPUT_TIMEZONE}, install tzdata "
+                               "(pip install -r requirements.txt)") from e
+    return _output_timezone
 
-    Args:
-        posts (list): List of RSS articles, each as a dictionary.
+def _to_output(parsed_date):
+    """
+    Converts a datetime to the stored string format in OUTPUT_TIMEZONE.
+    Naive datetimes are taken to be UTC.
+    """
+    if parsed_date.tzinfo is None:
+        parsed_date = parsed_date.replace(tzinfo=timezone.utc)
+    return parsed_date.astimezone(output_timezone()).strftime(OUTPUT_FORMAT)
 
-    Returns:
-        list: A list of dictionaries with filtered and necessary fields.
+def _parse_fallback(date_str):
+    """
+    Parses date strings none of the DATE_FORMATS match (RFC 822 variants, ISO 8601).
+    """
+    try:
+        return email.utils.parsedate_to_datetime(date_str)
+    except (TypeError, ValueError, IndexError):
+        pass
+    try:
+        return datetime.fromisoformat(date_str)
+    except ValueError:
+        pass
+    import pandas as pd
+
+    parsed = pd.to_datetime(date_str, errors="coerce", utc=True)
+    return None if pd.isna(parsed) else parsed.to_pydatetime()
+
+class DateNormalizer:
+    """
+    Converts RSS dates to YYYY-MM-DD HH:MM:SS and remembers, per feed, which
+    format worked, so later entries of the same feed parse in one attempt.
     """
-    allitems = []
 
-    for x in posts:
-        try:
-            tempdict = {
-                "title": x.get("title", ""),
-                "summary": x.get("summary", ""),
-                "link": x.get("link", ""),
-                "published": x.get("published", ""),
-            }
-            allitems.append(tempdict)
-        except Exception as e:
-            print(f"Error processing post: {e}")
-    
-    return allitems
+    def __init__(self):
+        self.feed_formats = {}  # feed -> index in DATE_FORMATS, or None for the fallback parsers
+        self.unparsed = 0
+
+    def normalize(self, date_str, parsed=None, feed=None):
+        """
+        Converts one RSS date.
+
+        Args:
+            date_str (str): The date string from the RSS feed.
+            parsed (time.struct_time): feedparser's parsed date (UTC), if available.
+            feed (str): Identifier of the feed the entry came from.
+
+        Returns:
+            str: A formatted date string or None if parsing fails.
+        """
+        if parsed:
+            return _to_output(datetime.fromtimestamp(calendar.timegm(parsed), tz=timezone.utc))
+        if not date_str or not isinstance(date_str, str):
+            return None
+        date_str = date_str.strip()
+
+        learned = self.feed_formats.get(feed, -1)
+        if learned is None:  # No DATE_FORMATS entry matched this feed before
+            parsed_date = _parse_fallback(date_str)
+            if parsed_date is not None:
+                return _to_output(parsed_date)
+        elif learned >= 0:
+            try:
+                return _to_output(datetime.strptime(date_str, DATE_FORMATS[learned]))
+            except ValueError:
+                pass
+
+        for index, fmt in enumerate(DATE_FORMATS):
+            try:
+                parsed_date = datetime.strptime(date_str, fmt)
+            except ValueError:
+                continue
+            self.feed_formats[feed] = index
+            return _to_output(parsed_date)
+
+        parsed_date = _parse_fallback(date_str) if learned is not None else None  # Already tried
+        if parsed_date is not None:
+            self.feed_formats[feed] = None
+            return _to_output(parsed_date)
+
+        self.unparsed += 1
+        print("Unknown format, could not parse:", date_str)
+        return None
+
+_default_normalizer = DateNormalizer()
 
 def format_date(date_str):
     """
@@ -41,48 +139,70 @@ def format_date(date_str):
     Returns:
         str: A formatted date string or None if parsing fails.
     """
-    if not date_str or pd.isna(date_str):
+    if date_str is None:
         return None
+    if not isinstance(date_str, str):
+        import pandas as pd
 
-    date_str = date_str.replace("GMT", "+0000")
-
-    date_formats = [
-        "%a, %d %b %Y %H:%M:%S %z",  # Example: "Mon, 05 Feb 2025 13:00:00 +0000"
-        "%Y-%m-%dT%H:%M:%S%z"         # Example: "2025-02-05T13:00:00+0000"
-    ]
-
-    for fmt in date_formats:
-        try:
-            parsed_date = datetime.strptime(date_str, fmt)
-            return parsed_date.strftime("%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            continue
-
-    print("Unknown format, could not parse:", date_str)
-    return None
+        if pd.isna(date_str):
+            return None
+    return _default_normalizer.normalize(date_str)
 
-def ThefinalList(AllItemsX):
+def format_dates_bulk(date_strings):
     """
-    Converts AllItemsX into a final 2D list, ensuring 'published' is formatted.
+    Vectorized date conversion for large batches and backfills.
+    Every known format is applied to the whole column at once; only values no
+    format matches go through the slower mixed-format parser.
 
     Args:
-        AllItemsX (list): List of dictionaries with RSS article data.
+        date_strings (iterable): RSS date strings.
 
     Returns:
-        list: A list of lists with [title, summary, link, published].
+        list: Formatted date strings, None where parsing failed.
     """
-    finalList = []
+    import pandas as pd
+
+    values = pd.Series(list(date_strings), dtype="object")
+    result = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns, UTC]")
+    for fmt in DATE_FORMATS:
+        missing = result.isna() & values.notna()
+        if not missing.any():
+            break
+        result[missing] = pd.to_datetime(values[missing], format=fmt.replace(" GMT", " %Z"),
+                                         errors="coerce", utc=True)
+    missing = result.isna() & values.notna()
+    if missing.any():
+        result[missing] = pd.to_datetime(values[missing], format="mixed", errors="coerce", utc=True)
+    formatted = result.dt.tz_convert(output_timezone()).dt.strftime(OUTPUT_FORMAT)
+    return [None if pd.isna(value) else value for value in formatted]
+
+def iter_records(posts, date_normalizer=None):
+    """
+    Normalizes RSS posts into records with a formatted 'published' date, one at a time.
 
-    for item in AllItemsX:
-        title = item.get("title", "")
-        summary = item.get("summary", "")
-        link = item.get("link", "")
-        published = format_date(item.get("published", ""))
+    Args:
+        posts (iterable): RSS articles, each as a dictionary.
+        date_normalizer (DateNormalizer): Keeps the learned per-feed date formats
+                                          (a new one is used when None).
 
-        if published:  # Only include items with valid published dates
-            finalList.append([title, summary, link, published])
-    
-    return finalList
+    Yields:
+        dict: A record with 'title', 'summary', 'link' and 'published'.
+              Posts without a valid published date are skipped.
+    """
+    date_normalizer = date_normalizer or DateNormalizer()
+    for item in posts:
+        try:
+            published = date_normalizer.normalize(item.get("published", ""),
+                                                  item.get("published_parsed"), item.get("source"))
+            if published:  # Only include items with valid published dates
+                yield {
+                    "title": item.get("title", ""),
+                    "summary": item.get("summary", ""),
+                    "link": item.get("link", ""),
+                    "published": published,
+                }
+        except Exception as e:
+            print(f"Error processing post: {e}")
 
 def main():
     """
@@ -92,13 +212,10 @@ def main():
 
     print('-----Starting FullRSSList_1_2.py-----')
 
-    # Extract necessary fields from the raw RSS posts
-    print("Extracting necessary fields from posts...")
-    all_items = gettingNecessaryList(posts)
-
-    # Create the final list with formatted dates
+    # Extract the necessary fields and format the dates in one pass
     print("Creating the final list...")
-    final_list = ThefinalList(all_items)
+    final_list = [[record["title"], record["summary"], record["link"], record["published"]]
+                  for record in iter_records(posts)]
 
     # Print the final list and its length
     #print(final_list)
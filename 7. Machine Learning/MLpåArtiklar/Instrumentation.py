@@ -0,0 +1,252 @@
+# Description: Per-stage instrumentation for the pipeline. Stage functions are
+# wrapped with @instrument("name") and report how many items they handled with
+# count(n). Every call records wall time, CPU time, peak memory and items per
+# second and appends one JSON line to METRICS_LOG. The totals per stage go to a Prometheus
+# textfile (METRICS_FILE) for node_exporter's textfile collector, rewritten when
+# an outermost stage call ends (at most every PROMETHEUS_INTERVAL seconds) and
+# at exit, so stages called per chunk do not rewrite it for every chunk.
+# The peak memory of a stage is the highest memory traced by tracemalloc while
+# it ran, above what was allocated when it started. The traced peak is reset
+# at every stage start and end and credited to all running stages, so nested
+# and concurrent stages each get their own peak (concurrent stages also see
+# each other's allocations). Tracing slows allocation-heavy code somewhat.
+# cpu_seconds is the CPU time of the thread running the stage; work done in
+# worker threads or processes is not included. process_cpu_seconds is the
+# CPU time of all threads of the process, including stages running at the
+# same time. process_peak_rss_mb is the resident-memory high-water mark of the
+# whole process since it started.
+# Setting ARTIKLAR_PROFILE_STAGE to a stage name profiles the first call of that
+# stage with cProfile and tracemalloc and writes the dumps to PROFILE_DIR.
+#
+# Environment: ARTIKLAR_METRICS=1 turns it on (it is off by default) and
+# ARTIKLAR_METRICS_DIR moves the output from the folder of this script.
+import atexit
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+ENABLED = os.environ.get("ARTIKLAR_METRICS", "0") == "1"
+
+# Folder of the metrics and profiles, by default next to the pipeline scripts
+METRICS_DIR = os.environ.get("ARTIKLAR_METRICS_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+# Structured log, one JSON object per stage call
+METRICS_LOG = os.path.join(METRICS_DIR, "metrics.jsonl")
+
+# Prometheus text format file with the totals per stage
+METRICS_FILE = os.path.join(METRICS_DIR, "metrics.prom")
+
+# Minimum seconds between two rewrites of METRICS_FILE
+PROMETHEUS_INTERVAL = 15
+
+# Stage to profile (first call only) and where the dumps go
+PROFILE_STAGE = os.environ.get("ARTIKLAR_PROFILE_STAGE", "")
+PROFILE_DIR = os.path.join(METRICS_DIR, "profiles")
+
+_lock = threading.Lock()
+_local = threading.local()
+_totals = {}  # Stage -> running totals for the Prometheus file
+_profiled = set()
+_prometheus = {'written_at': None, 'pending': False}
+_running = []  # Every running stage call in any thread, for the traced memory peaks
+
+def process_peak_rss_mb():
+    """
+    Returns the peak resident memory of the process since it started in MB,
+    or None if unknown. This is a process-wide high-water mark, not the
+    memory used by any one stage.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024  # Bytes on macOS, KB on Linux
+
+def count(items):
+    """
+    Adds 'items' to the item count of the innermost running stage.
+    """
+    stack = getattr(_local, "stack", None)
+    if stack:
+        stack[-1]['items'] += items
+
+def _credit_traced_peak():
+    """
+    Credits the traced memory peak since the last reset to every running stage
+    call and resets it. Called with _lock held.
+    """
+    peak = tracemalloc.get_traced_memory()[1]
+    for call in _running:
+        call['traced_peak'] = max(call['traced_peak'], peak)
+    tracemalloc.reset_peak()
+
+def _write_log(record):
+    with open(METRICS_LOG, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def _write_prometheus():
+    metrics = [
+        ("artiklar_stage_runs_total", "counter", "Number of completed stage calls.", 'runs'),
+        ("artiklar_stage_errors_total", "counter", "Number of stage calls that raised.", 'errors'),
+        ("artiklar_stage_seconds_total", "counter", "Wall time spent in the stage.", 'seconds'),
+        ("artiklar_stage_cpu_seconds_total", "counter", "CPU time of the thread running the stage.", 'cpu_seconds'),
+        ("artiklar_stage_items_total", "counter", "Items handled by the stage.", 'items'),
+        ("artiklar_stage_last_seconds", "gauge", "Wall time of the latest call.", 'last_seconds'),
+        ("artiklar_stage_last_items_per_second", "gauge", "Throughput of the latest call.", 'last_items_per_second'),
+        ("artiklar_stage_last_peak_memory_megabytes", "gauge",
+         "Peak traced memory of the latest call above its start.", 'last_peak_memory_mb'),
+    ]
+    lines = []
+    for name, kind, help_text, key in metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for stage, totals in sorted(_totals.items()):
+            if totals.get(key) is not None:
+                lines.append(f'{name}{{stage="{stage}"}} {totals[key]}')
+    peak = process_peak_rss_mb()
+    if peak is not None:
+        lines.append("# HELP artiklar_process_peak_rss_megabytes Peak resident memory of the process since it started.")
+        lines.append("# TYPE artiklar_process_peak_rss_megabytes gauge")
+        lines.append(f"artiklar_process_peak_rss_megabytes {peak}")
+    tmp_path = f"{METRICS_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, METRICS_FILE)  # The collector never sees a half-written file
+    _prometheus['written_at'] = time.monotonic()
+    _prometheus['pending'] = False
+
+def flush():
+    """
+    Writes the Prometheus file if totals were recorded since it was last written.
+    """
+    with _lock:
+        if _prometheus['pending']:
+            try:
+                _write_prometheus()
+            except OSError as e:
+                print(f"Could not write metrics: {e}")
+
+def _record(stage, items, seconds, cpu_seconds, process_cpu_seconds, peak_memory, outermost, error):
+    """
+    Logs one stage call and adds it to the totals. The Prometheus file is
+    rewritten after an outermost call unless it was written less than
+    PROMETHEUS_INTERVAL seconds ago; flush() at exit writes the rest.
+    """
+    record = {
+        'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'stage': stage,
+        'seconds': round(seconds, 6),
+        'cpu_seconds': round(cpu_seconds, 6),
+        'process_cpu_seconds': round(process_cpu_seconds, 6),
+        'items': items,
+        'items_per_second': round(items / seconds, 1) if seconds > 0 else None,
+        'peak_memory_mb': round(peak_memory / 2 ** 20, 3),
+        'process_peak_rss_mb': process_peak_rss_mb(),
+        'error': error
+    }
+    with _lock:
+        totals = _totals.setdefault(stage, {'runs': 0, 'errors': 0, 'seconds': 0.0, 'cpu_seconds': 0.0, 'items': 0})
+        totals['runs'] += 1
+        totals['errors'] += error is not None
+        totals['seconds'] += seconds
+        totals['cpu_seconds'] += cpu_seconds
+        totals['items'] += items
+        totals['last_seconds'] = record['seconds']
+        totals['last_items_per_second'] = record['items_per_second']
+        totals['last_peak_memory_mb'] = record['peak_memory_mb']
+        _prometheus['pending'] = True
+        written_at = _prometheus['written_at']
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            _write_log(record)
+            if outermost and (written_at is None or time.monotonic() - written_at >= PROMETHEUS_INTERVAL):
+                _write_prometheus()
+        except OSError as e:
+            print(f"Could not write metrics: {e}")
+    return record
+
+def _profile_dumps(stage, profiler, snapshot, traced_peak):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, f"{stage}_{time.strftime('%Y%m%d_%H%M%S')}")
+    profiler.dump_stats(f"{base}.prof")  # Open with: python -m pstats <file>
+    with open(f"{base}.tracemalloc.txt", "w", encoding="utf-8") as f:
+        f.write(f"Peak traced memory: {traced_peak / 2 ** 20:.2f} MB\n")
+        f.write("Allocations still alive at the end of the stage, by line:\n")
+        for stat in snapshot.statistics("lineno")[:50]:
+            f.write(f"{stat}\n")
+    print(f"Profile of stage '{stage}' written to {base}.prof and {base}.tracemalloc.txt")
+
+def instrument(stage):
+    """
+    Decorator that records one metrics entry per call of a stage function.
+    Args:
+        stage (str): Stage name used in the logs and as the Prometheus label.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+
+            stack = getattr(_local, "stack", None)
+            if stack is None:
+                stack = _local.stack = []
+
+            profiler = None
+            with _lock:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                _credit_traced_peak()
+                traced = tracemalloc.get_traced_memory()[0]
+                call = {'items': 0, 'traced_start': traced, 'traced_peak': traced}
+                _running.append(call)
+                if stage == PROFILE_STAGE and stage not in _profiled:
+                    _profiled.add(stage)
+                    profiler = cProfile.Profile()
+            stack.append(call)
+            if profiler:
+                profiler.enable()
+
+            cpu_start = time.thread_time()
+            process_cpu_start = time.process_time()
+            start = time.perf_counter()
+            error = None
+            try:
+                return func(*args, **kwargs)
+            except BaseException as e:
+                error = type(e).__name__
+                raise
+            finally:
+                seconds = time.perf_counter() - start
+                cpu_seconds = time.thread_time() - cpu_start
+                process_cpu_seconds = time.process_time() - process_cpu_start
+                with _lock:
+                    _credit_traced_peak()
+                    _running.remove(call)
+                stack.pop()
+                if profiler:
+                    profiler.disable()
+                    _profile_dumps(stage, profiler, tracemalloc.take_snapshot(), call['traced_peak'])
+                _record(stage, call['items'], seconds, cpu_seconds, process_cpu_seconds,
+                        call['traced_peak'] - call['traced_start'], not stack, error)
+        return wrapper
+    return decorator
+
+def summary():
+    """
+    Returns the running totals per stage (a copy).
+    """
+    with _lock:
+        return {stage: dict(totals) for stage, totals in _totals.items()}
+
+if ENABLED:
+    atexit.register(flush)
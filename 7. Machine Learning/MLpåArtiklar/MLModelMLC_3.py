@@ -1,66 +1,206 @@
 # Description: This script trains a machine learning model for multi-label 
 # classification using a Naive Bayes classifier.
+# Trained models are stored in the model registry (ModelRegistry.py) and reused
+# as long as the training data and the hyperparameter grid are unchanged.
+# In incremental mode (--incremental) the headlines are hashed by a stateless
+# HashingVectorizer and every label has its own MultinomialNB updated with
+# partial_fit, so rows appended to the CSV are folded into the previous model
+# without refitting on the old rows. The CSV is read in chunks, and the
+# hyperparameters are re-tuned on a bounded sample once the data has grown
+# by RETUNE_GROWTH since the last tune.
+# With COMPACT_MODEL (--compact) the trained TF-IDF model is pruned and stored
+# with float32 weights (ModelCompaction.py) before it is saved.
 
+import hashlib
+import itertools
+import math
+import os
 import sys
+import tempfile
+import time
 import warnings
-import nltk
+import joblib
+import numpy as np
 import pandas as pd
-from nltk.corpus import stopwords
-from nltk.stem.snowball import SnowballStemmer
-from sklearn.model_selection import train_test_split, GridSearchCV
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.model_selection import train_test_split, GridSearchCV, ParameterGrid
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
 from sklearn.pipeline import Pipeline
 from sklearn.multiclass import OneVsRestClassifier
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.metrics import accuracy_score
 
+import ModelRegistry
+import TextNormalizer
+import Instrumentation
+
 # Suppress warnings for clarity
 if not sys.warnoptions:
     warnings.simplefilter("ignore")
 
-def preprocess_text(data_raw):
+# Hyperparameter grid searched by train_model
+PARAM_GRID = {
+    'clf__estimator__alpha': [0.20, 0.21, 0.22],
+    'clf__estimator__fit_prior': [True, False]
+}
+
+# Hyperparameter search strategy: "grid" (exhaustive) or "halving" (successive halving)
+SEARCH = "grid"
+
+# Number of worker processes used for training (1 = serial, -1 = all cores)
+N_JOBS = 1
+
+# Swedish stemming of the headlines (memoized per token, see TextNormalizer.CachedStemmer)
+USE_STEMMING = True
+
+# Train incrementally with partial_fit instead of a full grid search
+INCREMENTAL = False
+
+# Prune the trained TF-IDF model before saving it (see ModelCompaction.py)
+COMPACT_MODEL = False
+
+# Number of hashed features in incremental mode
+HASH_FEATURES = 2 ** 18
+
+# Rows of the labeled CSV read at a time in incremental mode
+CSV_CHUNK_ROWS = 10000
+
+# Full re-tune once the data has grown by this share since the last tune
+RETUNE_GROWTH = 1.0
+
+# Rows sampled from the CSV for a re-tune
+TUNE_SAMPLE_ROWS = 50000
+
+def training_config(search=SEARCH, stemming=USE_STEMMING, incremental=INCREMENTAL, compact=COMPACT_MODEL):
     """
-    Preprocesses the text data by cleaning and removing stopwords.
+    Returns the training configuration that, together with the training CSV,
+    identifies a model artifact in the registry.
     """
-    data_raw['Heading'] = (
-        data_raw['Heading']
-        .str.lower()
-        .str.replace(r'[^\w\s]', '', regex=True)
-        .str.replace(r'\d+', '', regex=True)
-        .str.replace(r'<.*?>', '', regex=True)
-    )
-
-    #nltk.download('stopwords')
-    stop_words = set(stopwords.words('swedish'))
+    config = {
+        'param_grid': PARAM_GRID,
+        'search': search,
+        'normalizer': TextNormalizer.VERSION,
+        'stemming': stemming,
+    }
+    if incremental:
+        config['incremental'] = {'hash_features': HASH_FEATURES, 'ngram_range': [1, 3]}
+    elif compact:
+        import ModelCompaction
 
-    def remove_stopwords(sentence):
-        return " ".join([word for word in nltk.word_tokenize(sentence) if word not in stop_words])
+        config['compaction'] = ModelCompaction.settings()
+    return config
 
-    data_raw['Heading'] = data_raw['Heading'].apply(remove_stopwords)
+def make_normalizer(stemming=USE_STEMMING, n_jobs=1):
+    """
+    Creates the text normalizer used for both training and inference.
+    Args:
+        stemming (bool): Stem tokens through the persisted stem cache.
+        n_jobs (int): Number of worker processes for large batches.
+    Returns:
+        TextNormalizer: The configured normalizer.
+    """
+    stemmer = TextNormalizer.CachedStemmer(path=TextNormalizer.STEM_CACHE_PATH) if stemming else None
+    return TextNormalizer.TextNormalizer(n_jobs=n_jobs, stemmer=stemmer)
 
-    stemmer = SnowballStemmer("swedish")
+def share_matrix(x, folder):
+    """
+    Dumps a (sparse) feature matrix to 'folder' and loads it back memory-mapped.
+    Worker processes then receive the file name instead of a pickled copy of
+    the matrix for every task.
+    Args:
+        x: Feature matrix (scipy sparse or numpy).
+        folder (str): Directory for the memory-mapped buffers.
+    Returns:
+        The same matrix backed by read-only memory-mapped arrays.
+    """
+    path = os.path.join(folder, "x_train.joblib")
+    joblib.dump(x, path)
+    return joblib.load(path, mmap_mode="r")
 
-    def stemming(sentence):
-        return " ".join([stemmer.stem(word) for word in sentence.split()])
+def preprocess_text(data_raw, n_jobs=N_JOBS, stemming=USE_STEMMING):
+    """
+    Preprocesses the text data by cleaning, removing stopwords and (optionally) stemming.
+    The whole column is normalized in one batch by TextNormalizer.
+    """
+    normalizer = make_normalizer(stemming, n_jobs)
+    data_raw['Heading'] = normalizer.normalize_batch(data_raw['Heading'])
+    print(f"Normalized {len(data_raw)} headlines ({normalizer.throughput:.0f} headlines/s).")
 
-    # Uncomment if stemming is needed
-    # data_raw['Heading'] = data_raw['Heading'].apply(stemming)
+    if normalizer.stemmer:
+        print(f"Stem cache hit rate: {normalizer.stemmer.hit_rate:.1%}")
+        normalizer.stemmer.save()
 
     return data_raw
 
-def train_model(data_path):
+def successive_halving(pipeline, param_grid, x_train, y_train, n_jobs=N_JOBS, factor=3, cv=5):
+    """
+    Successive-halving hyperparameter search for the multi-label pipeline.
+    All candidates are first scored on a small share of the training rows; only
+    the best 1/factor of them survive to the next round, which uses factor times
+    more rows, until one candidate is left or all rows are used. The last
+    candidate is returned with its score from the round it won, without a
+    round of its own.
+    (sklearn's HalvingGridSearchCV does not accept multi-label targets.)
+    Args:
+        pipeline: The estimator to tune.
+        param_grid (dict): Hyperparameter grid.
+        x_train: Feature matrix (rows are already shuffled).
+        y_train (DataFrame): Label matrix.
+        n_jobs (int): Number of worker processes per round.
+        factor (int): Reduction factor between rounds.
+        cv (int): Number of cross-validation folds.
+    Returns:
+        tuple: (best parameters, best cross-validated score)
+    """
+    candidates = list(ParameterGrid(param_grid))
+    n_rows = x_train.shape[0]
+    # Rounds until one candidate is left; the last of them uses all rows
+    n_rounds = max(1, math.ceil(math.log(len(candidates), factor))) if len(candidates) > 1 else 1
+    n_resources = max(cv * 2, n_rows // factor ** (n_rounds - 1))
+
+    while True:
+        n_resources = min(n_resources, n_rows)
+        search = GridSearchCV(pipeline, [{key: [value] for key, value in candidate.items()} for candidate in candidates],
+                              cv=cv, scoring='accuracy', refit=False, n_jobs=n_jobs)
+        search.fit(x_train[:n_resources], y_train.iloc[:n_resources])
+        scores = search.cv_results_['mean_test_score']
+        ranking = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        print(f"  {len(candidates)} candidates on {n_resources} rows, best score {scores[ranking[0]]:.4f}")
+
+        if len(candidates) == 1 or n_resources == n_rows:
+            return candidates[ranking[0]], scores[ranking[0]]
+        if len(candidates) <= factor:  # Only the winner would survive
+            return candidates[ranking[0]], scores[ranking[0]]
+        candidates = [candidates[i] for i in ranking[:math.ceil(len(candidates) / factor)]]
+        n_resources = n_rows if len(candidates) <= factor else n_resources * factor  # Last round on all rows
+
+@Instrumentation.instrument("train")
+def train_model(data_path, param_grid=PARAM_GRID, n_jobs=N_JOBS, search=SEARCH, stemming=USE_STEMMING):
     """
     Trains the machine learning model and returns the best pipeline and vectorizer.
+    With n_jobs != 1 the cross-validation folds of the search, and the per-label
+    fits of the final model, run in a process pool that shares the TF-IDF matrix
+    through memory-mapped buffers.
+    Args:
+        data_path (str): Path to the labeled training CSV.
+        param_grid (dict): Hyperparameter grid for the search.
+        n_jobs (int): Number of worker processes (1 = serial, -1 = all cores).
+        search (str): "grid" for an exhaustive search, "halving" for successive halving.
+        stemming (bool): Stem the headlines before vectorizing.
+    Returns:
+        tuple: (vectorizer, best_clf_pipeline, categories, test_text, test,
+                document_frequencies), the last being the number of training
+                headlines every feature occurs in (used by ModelCompaction).
     """
     print("Loading data...")
     data_raw = pd.read_csv(data_path)
+    Instrumentation.count(len(data_raw))
 
     print("Shuffling data...")
     data_raw = data_raw.sample(frac=1)
 
     print("Preprocessing data...")
     categories = list(data_raw.columns.values)[2:]  # Excluding 'Id' and 'Heading'
-    data_raw = preprocess_text(data_raw)
+    data_raw = preprocess_text(data_raw, n_jobs, stemming)
 
     print("Splitting data into train and test sets...")
     train, test = train_test_split(data_raw, random_state=42, test_size=0.30, shuffle=True)
@@ -71,6 +211,7 @@ def train_model(data_path):
     vectorizer.fit(train_text)
 
     x_train = vectorizer.transform(train_text)
+    document_frequencies = np.asarray((x_train > 0).sum(axis=0)).ravel()
     y_train = train.drop(labels=['Id', 'Heading'], axis=1)
 
     print("Setting up the ML pipeline...")
@@ -78,54 +219,312 @@ def train_model(data_path):
         ('clf', OneVsRestClassifier(MultinomialNB())),
     ])
 
-    print("Performing hyperparameter tuning...")
-    param_grid = {
-        'clf__estimator__alpha': [0.20, 0.21, 0.22],
-        'clf__estimator__fit_prior': [True, False]
-    }
+    # Worker processes may still hold the memory-mapped files when the folder is removed (Windows)
+    with tempfile.TemporaryDirectory(prefix="mlmodel_", ignore_cleanup_errors=True) as shared_folder:
+        if n_jobs != 1:
+            x_train = share_matrix(x_train, shared_folder)
+
+        print(f"Performing hyperparameter tuning ({search} search, n_jobs={n_jobs})...")
+        if search == "halving":
+            best_params, best_score = successive_halving(MultinomialNB_pipeline, param_grid,
+                                                         x_train, y_train, n_jobs)
+        else:
+            grid = GridSearchCV(MultinomialNB_pipeline, param_grid, cv=5, scoring='accuracy',
+                                refit=False, n_jobs=n_jobs)
+            grid.fit(x_train, y_train)
+            best_params, best_score = grid.best_params_, grid.best_score_
+
+        print("Best score: ", best_score)
+        print("Best params: ", best_params)
+
+        # Refit once on the full training set, spreading the per-label fits over the pool
+        best_clf_pipeline = MultinomialNB_pipeline.set_params(**best_params, clf__n_jobs=n_jobs)
+        best_clf_pipeline.fit(x_train, y_train)
+        best_clf_pipeline.set_params(clf__n_jobs=None)  # Keep inference single-process
+        print("Best estimator: ", best_clf_pipeline)
+        del x_train  # Unmaps the shared matrix before its folder is removed
+
+    return vectorizer, best_clf_pipeline, categories, test_text, test, document_frequencies
+
+class PerLabelNB:
+    """
+    One MultinomialNB per label, each updated with partial_fit. predict_proba()
+    returns the same (n_articles, n_labels) matrix as the OneVsRestClassifier
+    pipeline, so the incremental model is used for inference unchanged.
+    (OneVsRestClassifier.partial_fit does not accept multi-label targets.)
+    Args:
+        n_labels (int): Number of labels.
+        alpha (float): Additive smoothing of every MultinomialNB.
+        fit_prior (bool): Learn the class priors.
+    """
+
+    def __init__(self, n_labels, alpha=1.0, fit_prior=True):
+        self.estimators_ = [MultinomialNB(alpha=alpha, fit_prior=fit_prior) for _ in range(n_labels)]
 
-    grid = GridSearchCV(MultinomialNB_pipeline, param_grid, cv=5, scoring='accuracy')
-    grid.fit(x_train, y_train)
+    def partial_fit(self, x, y):
+        y = np.asarray(y)
+        for label, estimator in enumerate(self.estimators_):
+            estimator.partial_fit(x, y[:, label], classes=[0, 1])
+        return self
 
-    print("Best score: ", grid.best_score_)
-    print("Best params: ", grid.best_params_)
-    print("Best estimator: ", grid.best_estimator_)
+    def predict_proba(self, x):
+        return np.column_stack([estimator.predict_proba(x)[:, 1] for estimator in self.estimators_])
 
-    best_clf_pipeline = grid.best_estimator_
-    best_clf_pipeline.fit(x_train, y_train)
+def hashing_vectorizer():
+    """
+    Returns the stateless vectorizer of the incremental mode (no vocabulary to refit).
+    alternate_sign=False keeps the counts non-negative for MultinomialNB.
+    """
+    return HashingVectorizer(n_features=HASH_FEATURES, strip_accents='unicode', analyzer='word',
+                             ngram_range=(1, 3), norm='l2', alternate_sign=False)
+
+def read_labeled_chunks(data_path, start_row=0, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Reads the labeled CSV in chunks, starting at data row 'start_row'.
+    Yields:
+        DataFrame: At most 'chunk_rows' rows ('Id', 'Heading' and one column per category).
+    """
+    yield from pd.read_csv(data_path, skiprows=range(1, start_row + 1), chunksize=chunk_rows)
 
-    return vectorizer, best_clf_pipeline, categories, test_text, test
+def count_rows(data_path, start_row=0, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Counts the data rows of the CSV from data row 'start_row' on, reading only the 'Id' column.
+    """
+    return sum(len(chunk) for chunk in pd.read_csv(data_path, usecols=['Id'], skiprows=range(1, start_row + 1),
+                                                   chunksize=chunk_rows))
+
+def row_fingerprint(row):
+    """
+    Identifies a CSV row by its Id and raw headline, to check that the rows
+    an incremental model was trained on are still in place.
+    """
+    return hashlib.sha256(f"{row['Id']}\x1f{row['Heading']}".encode("utf-8")).hexdigest()[:16]
+
+def fold_in(model, chunks, categories, vectorizer, normalizer):
+    """
+    Updates the model with partial_fit, chunk by chunk. Every chunk is scored
+    before the model learns from it (progressive validation), with the
+    inference thresholds as in evaluate_model.
+    Returns:
+        tuple: (rows added, exact-match accuracy on the rows scored, fingerprint of the last row)
+    """
+    import MLModelReturns_4
+
+    thresholds = MLModelReturns_4.category_thresholds(categories)
+    rows = scored = correct = 0
+    last_row = None
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        x = vectorizer.transform(normalizer.normalize_batch(chunk['Heading'].astype(str)))
+        y = chunk[categories].to_numpy()
+        if hasattr(model.estimators_[0], 'class_count_'):  # Fitted before
+            predicted = model.predict_proba(x) >= thresholds
+            correct += int((predicted == y.astype(bool)).all(axis=1).sum())
+            scored += len(chunk)
+        model.partial_fit(x, y)
+        rows += len(chunk)
+        last_row = row_fingerprint(chunk.iloc[-1])
+        Instrumentation.count(len(chunk))
+    return rows, correct / scored if scored else None, last_row
+
+def tune_sample(data_path, categories, vectorizer, normalizer, param_grid=PARAM_GRID,
+                sample_rows=TUNE_SAMPLE_ROWS, n_jobs=N_JOBS, seed=42):
+    """
+    Grid-searches the hyperparameters on a uniform random sample of at most
+    'sample_rows' rows, collected chunk by chunk so memory stays bounded.
+    Returns:
+        dict: The best parameters (PARAM_GRID names).
+    """
+    rng = np.random.default_rng(seed)
+    sample = None
+    for chunk in read_labeled_chunks(data_path):
+        chunk = chunk.assign(_sample_key=rng.random(len(chunk)))
+        sample = chunk if sample is None else pd.concat([sample, chunk])
+        sample = sample.nsmallest(sample_rows, '_sample_key')  # Bottom-k sampling
+    x = vectorizer.transform(normalizer.normalize_batch(sample['Heading'].astype(str)))
+    pipeline = Pipeline([('clf', OneVsRestClassifier(MultinomialNB()))])
+    grid = GridSearchCV(pipeline, param_grid, cv=5, scoring='accuracy', refit=False, n_jobs=n_jobs)
+    grid.fit(x, sample[categories])
+    print(f"Tuned on {len(sample)} sampled rows, best score {grid.best_score_:.4f}: {grid.best_params_}")
+    return grid.best_params_
 
+def previous_incremental(config):
+    """
+    Returns the manifest entry of the newest incremental model trained with 'config', or None.
+    """
+    for entry in reversed(ModelRegistry.load_manifest()):
+        if entry.get('config') == config and 'incremental' in entry:
+            return entry
+    return None
+
+@Instrumentation.instrument("train")
+def train_incremental(data_path, config, retune=False, n_jobs=N_JOBS):
+    """
+    Folds the rows added to the CSV since the previous incremental model into
+    it, or re-tunes and rebuilds the model from all rows when there is no
+    previous model, the old rows changed, the data grew by RETUNE_GROWTH since
+    the last tune, or 'retune' is set.
+    Args:
+        data_path (str): Path to the labeled training CSV (rows are only appended).
+        config (dict): Training configuration from training_config(incremental=True).
+        retune (bool): Force a full re-tune.
+        n_jobs (int): Worker processes for the re-tune grid search.
+    Returns:
+        tuple: (artifact, manifest metadata)
+    """
+    categories = list(pd.read_csv(data_path, nrows=0).columns.values)[2:]  # Excluding 'Id' and 'Heading'
+    vectorizer = hashing_vectorizer()
+    normalizer = make_normalizer(config['stemming'])
+    entry = previous_incremental(config)
+    artifact = None
+    if entry is not None and not retune:
+        artifact = ModelRegistry.load_artifact(entry['key'], mmap_mode=None)  # Updated in memory
+
+    state = None
+    if artifact is not None:
+        state = entry['incremental']
+        chunks = read_labeled_chunks(data_path, start_row=state['rows'] - 1)
+        first = next(chunks, None)
+        if first is None or first.empty or row_fingerprint(first.iloc[0]) != state['last_row']:
+            print("The rows of the previous model changed, re-tuning on all rows...")
+            state = None
+        else:
+            total_rows = state['rows'] + count_rows(data_path, start_row=state['rows'])  # Including the new rows
+            if total_rows >= state['tuned_rows'] * (1 + RETUNE_GROWTH):
+                print(f"The data grew from {state['tuned_rows']} to {total_rows} rows since the last tune, re-tuning...")
+                state = None
+
+    if state is not None:
+        model = artifact['best_clf_pipeline']
+        print(f"Folding new rows into model {entry['key']} ({state['rows']} rows)...")
+        added, accuracy, last_row = fold_in(model, itertools.chain([first.iloc[1:]], chunks),
+                                            categories, vectorizer, normalizer)
+        state = dict(state, rows=state['rows'] + added, last_row=last_row or state['last_row'],
+                     updates=state['updates'] + 1)
+        print(f"Added {added} rows.")
+    else:
+        best_params = tune_sample(data_path, categories, vectorizer, normalizer, config['param_grid'], n_jobs=n_jobs)
+        model = PerLabelNB(len(categories), best_params['clf__estimator__alpha'],
+                           best_params['clf__estimator__fit_prior'])
+        print("Building the model from all rows...")
+        added, accuracy, last_row = fold_in(model, read_labeled_chunks(data_path), categories, vectorizer, normalizer)
+        state = {'rows': added, 'last_row': last_row, 'tuned_rows': added, 'params': best_params, 'updates': 0}
+    state['replaces'] = entry['key'] if entry else None  # Every row of that model is in this one
+
+    if accuracy is not None:
+        print(f"Progressive accuracy on the new rows: {accuracy:.4f}")
+    if normalizer.stemmer:
+        normalizer.stemmer.save()
+    artifact = {
+        'vectorizer': vectorizer,
+        'best_clf_pipeline': model,
+        'categories': categories,
+        'stemming': config['stemming']
+    }
+    return artifact, {'data_path': data_path, 'config': config, 'accuracy': accuracy, 'incremental': state}
+
+@Instrumentation.instrument("evaluate")
 def evaluate_model(vectorizer, best_clf_pipeline, test_text, test):
     """
-    Evaluates the trained model on test data.
+    Evaluates the trained model on test data, with the thresholds used for
+    inference (MLModelReturns_4.THRESHOLD and CATEGORY_THRESHOLDS).
     """
+    import MLModelReturns_4
+
     print("Transforming test data...")
+    Instrumentation.count(len(test_text))
     x_test = vectorizer.transform(test_text)
     y_test = test.drop(labels=['Id', 'Heading'], axis=1)
 
     print("Predicting test data...")
     y_pred_proba = best_clf_pipeline.predict_proba(x_test)
-    threshold = 0.3  # Adjust threshold if needed
-    y_pred = (y_pred_proba >= threshold).astype(int)
+    thresholds = MLModelReturns_4.category_thresholds(list(y_test.columns))
+    y_pred = (y_pred_proba >= thresholds).astype(int)
 
     accuracy = accuracy_score(y_test, y_pred)
     print("Accuracy:", accuracy)
+    return accuracy
 
-def main():
+def main(data_path="Book1.csv", force_retrain=False, n_jobs=N_JOBS, search=SEARCH, incremental=INCREMENTAL,
+         compact=COMPACT_MODEL):
     """
     Main function to orchestrate model training and evaluation.
+    Loads the model from the registry when an artifact for the current training
+    data and configuration exists, otherwise trains, evaluates and saves it.
+    Args:
+        data_path (str): Path to the labeled training CSV.
+        force_retrain (bool): Train a new model even if an artifact exists
+                              (a full re-tune in incremental mode).
+        n_jobs (int): Number of training processes (1 = serial, -1 = all cores).
+        search (str): "grid" or "halving" hyperparameter search.
+        incremental (bool): Fold new CSV rows into the previous incremental model.
+        compact (bool): Save a pruned float32 model (ignored in incremental mode).
     """
     print('-----Starting MLModelMLC_3.py-----')
-    global categories, vectorizer, best_clf_pipeline  # Make these global for other scripts to import
-    data_path = "Book1.csv"  # Adjust path to your data file
+    global categories, vectorizer, best_clf_pipeline, use_stemming  # Make these global for other scripts to import
+
+    config = training_config(search, incremental=incremental, compact=compact)
+    key = ModelRegistry.artifact_key(data_path, config)
+    if not force_retrain:
+        start = time.perf_counter()
+        artifact = ModelRegistry.load_artifact(key)
+        if artifact is not None:
+            vectorizer = artifact['vectorizer']
+            best_clf_pipeline = artifact['best_clf_pipeline']
+            categories = artifact['categories']
+            use_stemming = artifact.get('stemming', False)
+            print(f"Loaded model {key} from the registry in {time.perf_counter() - start:.3f} seconds.")
+            return
+
+    if incremental:
+        artifact, metadata = train_incremental(data_path, config, force_retrain, n_jobs)
+        vectorizer = artifact['vectorizer']
+        best_clf_pipeline = artifact['best_clf_pipeline']
+        categories = artifact['categories']
+        use_stemming = artifact['stemming']
+        path = ModelRegistry.save_artifact(key, artifact, metadata)
+        print(f"Saved model {key} to {path} ({metadata['incremental']['rows']} rows).")
+        replaced = metadata['incremental'].get('replaces')
+        if replaced and replaced != key:
+            ModelRegistry.remove_artifact(replaced)
+        return
 
     print("Starting model training...")
-    vectorizer, best_clf_pipeline, categories, test_text, test = train_model(data_path)
+    vectorizer, best_clf_pipeline, categories, test_text, test, document_frequencies = train_model(
+        data_path, config['param_grid'], n_jobs, search, config['stemming'])
+    use_stemming = config['stemming']
 
     print("Evaluating model...")
-    evaluate_model(vectorizer, best_clf_pipeline, test_text, test)
+    accuracy = evaluate_model(vectorizer, best_clf_pipeline, test_text, test)
+
+    artifact = {
+        'vectorizer': vectorizer,
+        'best_clf_pipeline': best_clf_pipeline,
+        'categories': categories,
+        'stemming': use_stemming
+    }
+    metadata = {'data_path': data_path, 'config': config, 'accuracy': accuracy}
+    if 'compaction' in config:
+        import ModelCompaction
+
+        artifact = ModelCompaction.compact_artifact(artifact, document_frequencies, config['compaction']['min_df'],
+                                                    config['compaction']['max_features'])
+        vectorizer = artifact['vectorizer']
+        best_clf_pipeline = artifact['best_clf_pipeline']
+        print(f"Compacted the model from {artifact['compaction']['features_before']} to "
+              f"{artifact['compaction']['features_after']} features.")
+        metadata['accuracy_full'] = accuracy
+        metadata['accuracy'] = evaluate_model(vectorizer, best_clf_pipeline, test_text, test)
+    path = ModelRegistry.save_artifact(key, artifact, metadata)
+    print(f"Saved model {key} to {path}.")
 
     print("Model training and evaluation completed.")
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(
+        force_retrain="--retrain" in sys.argv,
+        n_jobs=-1 if "--parallel" in sys.argv else N_JOBS,
+        search="halving" if "--halving" in sys.argv else SEARCH,
+        incremental="--incremental" in sys.argv or INCREMENTAL,
+        compact="--compact" in sys.argv or COMPACT_MODEL
+    )
\ No newline at end of file
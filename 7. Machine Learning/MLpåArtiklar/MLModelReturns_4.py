@@ -1,95 +1,275 @@
-# Description: This script is the fourth script in the pipeline. 
-# It imports the output from the previous scripts and uses the ML model 
-# to predict the categories of the new articles. It then combines the predictions 
-# with the final list of articles and validates the final structure with a JSON 
+# Description: This script is the fourth script in the pipeline.
+# It imports the output from the previous scripts and uses the ML model
+# to predict the categories of the new articles. It then combines the predictions
+# with the final list of articles and validates the final structure with a JSON
 # schema. The final list is saved as 'validDict' for further processing.
+# iter_batches() runs the same steps as a stream: every RSS entry is
+# normalized, date-parsed, classified and validated in one pass, and handed on
+# in chunks of CHUNK_SIZE records, so memory does not grow with the run size.
+# Each chunk is an ArticleBatch (columns plus a sparse label matrix) that is
+# validated as a whole and read directly by DbTransfer_5.
+# The ML stack (MLModelMLC_3 -> sklearn, numpy, scipy) is imported on first
+# use, so the feeds are fetched before any of it is loaded and a run without
+# new articles never loads it at all.
+# The loaded model scores all categories at once (FusedScorer): the weights of
+# the per-category naive Bayes estimators are stacked into one matrix, so a
+# chunk costs one sparse x dense product instead of one per category.
 
-import RssFeedNewArticle_2
-import MLModelMLC_3
+import itertools
+
+import RssArticles_1
 import FullRSSList_1_2
+import Instrumentation
+from ArticleBatch import ArticleBatch, BatchValidator, SCHEMA
 
-import jsonschema
+# Number of records classified, validated and written together
+CHUNK_SIZE = 500
 
-def main():
-    MLModelMLC_3.main() # Run the ML model training script
-    categories = MLModelMLC_3.categories # Import the categories
-    vectorizer = MLModelMLC_3.vectorizer # Import the vectorizer
-    best_clf_pipeline = MLModelMLC_3.best_clf_pipeline # Import the best classifier pipeline
+# Probability needed for a category to be assigned
+THRESHOLD = 0.3
 
-    RssFeedNewArticle_2.main() # Run the RSS feed script (also runs the RssArticles_1 script inside, so posts are available)
-    printdepositlist = RssFeedNewArticle_2.printdepositlist # Import the printdepositlist
+# Per-category overrides of THRESHOLD, e.g. {'Religion': 0.2}
+CATEGORY_THRESHOLDS = {}
 
-    FullRSSList_1_2.main()  # Run the FullRSSList script (needs posts from RssArticles_1, activated from RssFeedNewArticle_2)
-    MyTheFinalList = FullRSSList_1_2.MyTheFinalList # Import the MyTheFinalList
-    
-    print('-----Starting MLModelReturns_4.py-----')
+_validator = None
+
+def get_validator():
+    """
+    Returns the BatchValidator for SCHEMA, compiled on first use and then reused for every batch.
+    """
+    global _validator
+    if _validator is None:
+        _validator = BatchValidator(SCHEMA)
+    return _validator
+
+def chunked(iterable, size):
+    """
+    Splits an iterable into lists of at most 'size' items without reading ahead.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def category_thresholds(categories, default=THRESHOLD, overrides=None):
+    """
+    Builds the per-category threshold vector in model column order.
+    Args:
+        categories (list): Category names in model column order.
+        default (float): Threshold for categories without an override.
+        overrides (dict): Category name -> threshold, defaults to CATEGORY_THRESHOLDS.
+    Returns:
+        ndarray: One threshold per category.
+    """
+    overrides = CATEGORY_THRESHOLDS if overrides is None else overrides
+    import numpy as np
+
+    return np.array([overrides.get(category, default) for category in categories], dtype=np.float64)
+
+def decode_labels(probabilities, thresholds):
+    """
+    Applies the thresholds to the whole probability matrix at once.
+    Args:
+        probabilities (ndarray): predict_proba output, shape (n_articles, n_categories).
+        thresholds (float or ndarray): One threshold, or one per category.
+    Returns:
+        csr_matrix: Boolean label matrix; row i holds the category indices of article i.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    return sparse.csr_matrix(np.asarray(probabilities) >= thresholds)
+
+class FusedScorer:
+    """
+    Scores every label of a one-vs-rest naive Bayes model in one pass.
+    For a binary MultinomialNB, P(label | x) = sigmoid(x . w + b) with
+    w = feature_log_prob_[1] - feature_log_prob_[0] and
+    b = class_log_prior_[1] - class_log_prior_[0], so the w of all labels are
+    stacked into one (n_features, n_labels) matrix. predict_proba() returns the
+    same matrix as the OneVsRestClassifier (or PerLabelNB) it was built from.
+    Args:
+        estimators (list): One fitted binary MultinomialNB per label; a label
+                           that was constant in training has a _ConstantPredictor.
+    """
+
+    def __init__(self, estimators):
+        import numpy as np
+
+        fitted = [estimator for estimator in estimators if hasattr(estimator, "feature_log_prob_")]
+        if not fitted:
+            raise ValueError("No naive Bayes estimator to fuse.")
+        zeros = np.zeros(fitted[0].feature_log_prob_.shape[1], dtype=fitted[0].feature_log_prob_.dtype)
+        columns, bias = [], []
+        self.constant = {}  # Label index -> fixed probability
+        for label, estimator in enumerate(estimators):
+            if hasattr(estimator, "feature_log_prob_"):
+                if list(estimator.classes_) != [0, 1]:
+                    raise ValueError(f"Label {label} is not a binary 0/1 estimator.")
+                columns.append(estimator.feature_log_prob_[1] - estimator.feature_log_prob_[0])
+                bias.append(estimator.class_log_prior_[1] - estimator.class_log_prior_[0])
+            elif hasattr(estimator, "y_"):  # Label always (or never) set in the training data
+                columns.append(zeros)
+                bias.append(0.0)
+                self.constant[label] = float(estimator.y_[0])
+            else:
+                raise ValueError(f"Cannot fuse a {type(estimator).__name__}.")
+        self.weights = np.column_stack(columns)  # Row-major, as the sparse product reads it
+        self.bias = np.array(bias, dtype=np.float64)
+
+    def predict_proba(self, x):
+        """
+        Returns the probability of every label, shape (n_articles, n_labels).
+        """
+        import numpy as np
+        from scipy.special import expit
+
+        scores = np.asarray(x @ self.weights, dtype=np.float64)
+        scores += self.bias
+        expit(scores, out=scores)
+        for label, probability in self.constant.items():
+            scores[:, label] = probability
+        return scores
 
-    # 1. Extract text from 'printdepositlist' (title + summary)
-    print("Extracting title+summary from 'printdepositlist'...")
-    my_text = printdepositlist  # Assuming this is a list of combined title + summary strings
-
-    # 2. Remove empty strings
-    my_text_no_empty = [t for t in my_text if t.strip() != ""]
-
-    # 3. Transform text using vectorizer
-    print("Transforming text with vectorizer...")
-    my_text_transformed = vectorizer.transform(my_text_no_empty)
-
-    # 4. Predict categories with the model
-    print("Predicting categories with the model...")
-    predictions = best_clf_pipeline.predict_proba(my_text_transformed)
-
-    # 5. Assign categories based on a threshold
-    print("Assigning categories based on a threshold...")
-    threshold = 0.3
-    results = {}  # dict of text -> list of predicted categories
-    for idx, pvector in enumerate(predictions):
-        text = my_text_no_empty[idx]
-        predicted_categories = [categories[i] for i, prob in enumerate(pvector) if prob >= threshold]
-        results[text] = predicted_categories
-
-    # 6. Combine 'results' with 'MyTheFinalList'
-    print("Combining the predictions with the final list...")
-    combinedList = []
-    for idx, item in enumerate(MyTheFinalList):
-        title, summary, link, published = item
-        text = f"{title} {summary}"
-        predicted_topics = results.get(text, [])
-        combinedList.append([title, summary, link, published, predicted_topics])
-
-    # 7. Create a final list with dictionaries
-    key_list = ['title', 'summary', 'link', 'published', 'topic']
-    finalDict = [dict(zip(key_list, v)) for v in combinedList]
-
-    # 8. Validate final structure with JSON schema (optional)
-    print("Validating final structure with JSON schema...")
-    schema = {
-        "type": "object",
-        "properties": {
-            "title": {"type": "string"},
-            "summary": {"type": "string"},
-            "link": {"type": "string"},
-            "published": {"type": "string"},
-            "topic": {"type": "array", "items": {"type": "string"}}
-        },
-        "required": ["title", "summary", "link", "published", "topic"]
+def fused_scorer(best_clf_pipeline):
+    """
+    Returns a FusedScorer for the classifier of a fitted model, or the model
+    itself when it is not a multi-label set of binary naive Bayes estimators.
+    Args:
+        best_clf_pipeline: Pipeline([('clf', OneVsRestClassifier(MultinomialNB))]) or a PerLabelNB.
+    """
+    classifier = best_clf_pipeline
+    steps = getattr(best_clf_pipeline, "steps", None)
+    if steps is not None:
+        if len(steps) != 1:
+            return best_clf_pipeline
+        classifier = steps[0][1]
+    # A multi-class OneVsRestClassifier normalizes its rows, which the fused scorer does not
+    if not hasattr(classifier, "estimators_") or not getattr(classifier, "multilabel_", True):
+        return best_clf_pipeline
+    try:
+        return FusedScorer(classifier.estimators_)
+    except ValueError as e:
+        print(f"Scoring per estimator: {e}")
+        return best_clf_pipeline
+
+@Instrumentation.instrument("classify")
+def classify_chunk(batch, vectorizer, best_clf_pipeline, categories, normalizer, threshold=THRESHOLD):
+    """
+    Predicts the categories of a batch and stores them as its label matrix.
+    Articles with an empty title and summary get no categories.
+    Args:
+        batch (ArticleBatch): Articles with 'title', 'summary', 'link' and 'published'.
+        vectorizer: The fitted TF-IDF vectorizer.
+        best_clf_pipeline: The fitted classifier pipeline, or its FusedScorer.
+        categories (list): Category names in model column order.
+        normalizer (TextNormalizer): The normalizer the model was trained with.
+        threshold (float): Probability needed for a category to be assigned
+                           (per-category overrides come from CATEGORY_THRESHOLDS).
+    Returns:
+        ArticleBatch: The same batch with 'labels' and 'categories' set.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    Instrumentation.count(len(batch))
+    texts = batch.texts()
+    rows = [idx for idx, text in enumerate(texts) if text.strip() != ""]  # Remove empty strings
+
+    batch.categories = list(categories)
+    batch.labels = sparse.csr_matrix((len(batch), len(categories)), dtype=bool)
+    if not rows:
+        return batch
+
+    # Normalize the text the same way as the training data, then vectorize it
+    normalized = normalizer.normalize_batch(texts[idx] for idx in rows)
+    predictions = best_clf_pipeline.predict_proba(vectorizer.transform(normalized))
+
+    # Assign categories based on the thresholds, joined back by row index
+    labels = decode_labels(predictions, category_thresholds(categories, threshold))
+    if len(rows) == len(batch):
+        batch.labels = labels
+    else:
+        labels = labels.tocoo()
+        batch.labels = sparse.csr_matrix((labels.data, (np.asarray(rows)[labels.row], labels.col)),
+                                         shape=(len(batch), len(categories)))
+    return batch
+
+@Instrumentation.instrument("validate")
+def validate_chunk(batch):
+    """
+    Validates a whole batch against SCHEMA and returns the valid rows.
+    """
+    Instrumentation.count(len(batch))
+    validator = get_validator()
+    valid, failing = validator.validate(batch)
+    for row, message in validator.errors(batch, failing).items():
+        print(f"Validation error for row {row} ({batch.link[row]!r}): {message}")
+    if failing:
+        print(f"{len(failing)} of {len(batch)} records failed validation.")
+    return valid
+
+def load_model():
+    """
+    Loads (or trains) the ML model through MLModelMLC_3.
+    Returns:
+        dict: 'categories', 'vectorizer', 'best_clf_pipeline' (as a FusedScorer
+              when possible) and the matching 'normalizer'.
+    """
+    import MLModelMLC_3  # Loads sklearn, so only when a model is needed
+
+    MLModelMLC_3.main() # Run the ML model training script (loads from the registry when possible)
+    return {
+        'categories': MLModelMLC_3.categories, # Import the categories
+        'vectorizer': MLModelMLC_3.vectorizer, # Import the vectorizer
+        'best_clf_pipeline': fused_scorer(MLModelMLC_3.best_clf_pipeline), # Import the best classifier pipeline
+        'normalizer': MLModelMLC_3.make_normalizer(MLModelMLC_3.use_stemming)
     }
 
-    valid_list = []
-    for item in finalDict:
-        try:
-            jsonschema.validate(instance=item, schema=schema)
-            valid_list.append(item)
-        except jsonschema.exceptions.ValidationError as e:
-            print(f"Validation error for item {item}: {e}")
+def iter_batches(posts=None, chunk_size=CHUNK_SIZE, model=None):
+    """
+    Streams classified and validated records in chunks.
+    Args:
+        posts (iterable): RSS articles; when None, RssArticles_1 fetches the feeds.
+        chunk_size (int): Number of records per chunk.
+        model (dict): A model from load_model(); loaded here when None, on the
+                      first chunk, so a run without new articles skips it.
+    Yields:
+        ArticleBatch: The valid records of each chunk.
+    """
+    if posts is None:
+        RssArticles_1.main() # Fetch the RSS feeds
+        posts = RssArticles_1.posts
+
+    print('-----Starting MLModelReturns_4.py-----')
+    records = FullRSSList_1_2.iter_records(posts)
+    for chunk in chunked(records, chunk_size):
+        if model is None:
+            model = load_model()
+        batch = ArticleBatch.from_records(chunk)
+        del chunk  # The batch owns the values now
+        classify_chunk(batch, model['vectorizer'], model['best_clf_pipeline'], model['categories'], model['normalizer'])
+        yield validate_chunk(batch)
+
+    normalizer = model['normalizer'] if model else None
+    if normalizer and normalizer.stemmer:
+        print(f"Stem cache hit rate: {normalizer.stemmer.hit_rate:.1%}")
+        normalizer.stemmer.save()
+
+def main():
+    # Collect every streamed chunk into one list for scripts that need the whole batch
+    valid_list = [item for batch in iter_batches() for item in batch.to_records()]
 
-    # 9. Export the validated list as 'validDict'
+    # Export the validated list as 'validDict'
     global validDict  # To allow saving it later
     validDict = valid_list
     print(f"Number of valid dictionaries: {len(valid_list)}")
     #print("Validated dictionary:", validDict)
-    print(f"First Article (Verify appearance): {validDict[0]}")
+    if validDict:
+        print(f"First Article (Verify appearance): {validDict[0]}")
 
 # Run the script
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
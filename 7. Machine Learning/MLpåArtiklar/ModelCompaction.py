@@ -0,0 +1,257 @@
+# Description: Compacts a trained TF-IDF model for a smaller file, less memory
+# and faster loading. Most of the (1, 3)-gram vocabulary is trigrams seen in a
+# single headline, so features are pruned by document frequency (MIN_DF) and
+# optionally to the MAX_FEATURES most category-relevant ones by chi-squared.
+# The document frequencies are counted on the training matrix by
+# MLModelMLC_3.train_model, and chi-squared is computed from the per-class
+# feature sums every MultinomialNB keeps. The vocabulary is stored as a sorted numpy array of UTF-8 bytes
+# searched with a vectorized binary search instead of a Python dict (which has
+# to be rebuilt entry by entry on every load), and the naive Bayes
+# weights are recomputed from the counts of the kept features as float32.
+# MLModelMLC_3 uses the compact model when COMPACT_MODEL is set.
+#
+# Usage: python ModelCompaction.py [--min-df 2] [--max-features N]
+#        Trains a model on a held-out split and reports file size, load time
+#        and accuracy before and after compaction.
+
+import argparse
+import contextlib
+import copy
+import io
+import os
+import statistics
+import tempfile
+import time
+
+import joblib
+import numpy as np
+from scipy import sparse
+
+# Features must occur in at least this many training headlines
+MIN_DF = 2
+
+# Keep at most this many features, ranked by chi-squared (None keeps all that pass MIN_DF)
+MAX_FEATURES = None
+
+# Loads timed per model in the report
+LOAD_REPEAT = 5
+
+def settings(min_df=MIN_DF, max_features=MAX_FEATURES):
+    """
+    Returns the compaction settings, part of the registry key of a compact model.
+    """
+    return {'min_df': min_df, 'max_features': max_features, 'dtype': "float32"}
+
+def chi2_scores(estimators):
+    """
+    Returns the highest chi-squared statistic of every feature over all labels.
+    Uses the per-class feature sums each MultinomialNB keeps, which is the
+    statistic sklearn.feature_selection.chi2 computes from the training matrix.
+    """
+    best = None
+    for estimator in estimators:
+        observed = estimator.feature_count_
+        class_share = estimator.class_count_ / estimator.class_count_.sum()
+        expected = np.outer(class_share, observed.sum(axis=0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = np.nan_to_num(((observed - expected) ** 2 / expected).sum(axis=0))
+        best = scores if best is None else np.maximum(best, scores)
+    return best
+
+def select_features(document_frequencies, estimators, min_df=MIN_DF, max_features=MAX_FEATURES):
+    """
+    Returns the sorted column indices of the features to keep.
+    """
+    keep = np.asarray(document_frequencies) >= min_df
+    if max_features is not None and keep.sum() > max_features:
+        scores = np.where(keep, chi2_scores(estimators), -np.inf)
+        keep = np.zeros(len(keep), dtype=bool)
+        keep[np.argsort(-scores, kind="stable")[:max_features]] = True
+    return np.flatnonzero(keep)
+
+class CompactVectorizer:
+    """
+    TF-IDF vectorizer over a fixed vocabulary held in a sorted numpy array of UTF-8 bytes.
+    Tokenizes like the TfidfVectorizer it was built from and returns its matrix
+    restricted to the kept terms, normalized over those terms, as float32.
+    Args:
+        vectorizer (TfidfVectorizer): The fitted vectorizer.
+        columns (ndarray): Indices of the terms to keep.
+    """
+
+    _analyzer_params = ("input", "encoding", "decode_error", "strip_accents", "lowercase", "preprocessor",
+                        "tokenizer", "analyzer", "stop_words", "token_pattern", "ngram_range")
+
+    def __init__(self, vectorizer, columns):
+        terms = np.array([term.encode("utf-8") for term in vectorizer.get_feature_names_out()[columns]])
+        order = np.argsort(terms)
+        self.terms = terms[order]
+        self.idf = vectorizer.idf_[columns][order].astype(np.float32)
+        self.analyzer_params = {name: getattr(vectorizer, name) for name in self._analyzer_params}
+        self.norm = vectorizer.norm
+        self.sublinear_tf = vectorizer.sublinear_tf
+        self.use_idf = vectorizer.use_idf
+        self.order = order  # Position of every kept term in 'columns' order
+        self._analyze = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_analyze'] = None  # Rebuilt on first use after loading
+        return state
+
+    def transform(self, texts):
+        """
+        Converts texts into a float32 TF-IDF matrix (n_texts, n_terms).
+        """
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.preprocessing import normalize
+
+        if self._analyze is None:
+            self._analyze = TfidfVectorizer(**self.analyzer_params).build_analyzer()
+        lengths, tokens = [], []
+        for text in texts:
+            grams = self._analyze(text)
+            lengths.append(len(grams))
+            tokens.extend(gram.encode("utf-8") for gram in grams)
+        tokens = np.array(tokens, dtype=bytes)
+        if len(self.terms):
+            positions = np.minimum(np.searchsorted(self.terms, tokens), len(self.terms) - 1)
+            found = self.terms[positions] == tokens
+        else:
+            positions = found = np.zeros(len(tokens), dtype=bool)
+        rows = np.repeat(np.arange(len(lengths)), lengths)[found]
+        x = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, positions[found])),
+                              shape=(len(lengths), len(self.terms)))  # Repeated terms are summed
+        if self.sublinear_tf:
+            np.log(x.data, out=x.data)
+            x.data += 1
+        if self.use_idf:
+            x.data *= self.idf[x.indices]
+        return normalize(x, norm=self.norm, copy=False) if self.norm else x
+
+def compact_estimator(estimator, columns):
+    """
+    Returns a MultinomialNB restricted to 'columns' with float32 weights,
+    recomputed from the feature counts of the kept features. The counts are
+    dropped, so the compact estimator can predict but not be updated.
+    """
+    compact = copy.copy(estimator)
+    counts = estimator.feature_count_[:, columns] + estimator.alpha
+    compact.feature_log_prob_ = (np.log(counts) - np.log(counts.sum(axis=1, keepdims=True))).astype(np.float32)
+    compact.n_features_in_ = len(columns)
+    del compact.feature_count_
+    return compact
+
+def compact_artifact(artifact, document_frequencies, min_df=MIN_DF, max_features=MAX_FEATURES):
+    """
+    Builds the compact version of a TF-IDF model artifact.
+    Args:
+        artifact (dict): 'vectorizer', 'best_clf_pipeline', 'categories' and 'stemming'.
+        document_frequencies (ndarray): Training headlines every feature occurs in
+                                        (returned by MLModelMLC_3.train_model).
+        min_df (int): Minimum document frequency of a kept feature.
+        max_features (int): Keep at most this many features by chi-squared, None for all.
+    Returns:
+        dict: The compact artifact, with 'compaction' describing what was pruned.
+    """
+    from sklearn.pipeline import Pipeline
+
+    vectorizer = artifact['vectorizer']
+    if not hasattr(vectorizer, "idf_"):
+        raise ValueError("Only TF-IDF models can be compacted (the incremental model has no vocabulary).")
+    if len(document_frequencies) != len(vectorizer.idf_):
+        raise ValueError("The document frequencies do not belong to this vectorizer.")
+    classifier = artifact['best_clf_pipeline'].named_steps['clf']
+    columns = select_features(document_frequencies, classifier.estimators_, min_df, max_features)
+
+    compact_vectorizer = CompactVectorizer(vectorizer, columns)
+    columns = columns[compact_vectorizer.order]  # Estimator columns follow the sorted terms
+    compact_classifier = copy.copy(classifier)
+    compact_classifier.estimators_ = [compact_estimator(estimator, columns) for estimator in classifier.estimators_]
+    compact_classifier.n_features_in_ = len(columns)
+
+    return {
+        'vectorizer': compact_vectorizer,
+        'best_clf_pipeline': Pipeline([('clf', compact_classifier)]),
+        'categories': artifact['categories'],
+        'stemming': artifact.get('stemming', False),
+        'compaction': dict(settings(min_df, max_features), features_before=len(vectorizer.idf_),
+                           features_after=len(columns))
+    }
+
+def model_accuracy(artifact, test_text, y_test):
+    """
+    Exact-match accuracy of a model on normalized held-out headlines (as MLModelMLC_3.evaluate_model).
+    """
+    from sklearn.metrics import accuracy_score
+    import MLModelReturns_4
+
+    probabilities = artifact['best_clf_pipeline'].predict_proba(artifact['vectorizer'].transform(test_text))
+    thresholds = MLModelReturns_4.category_thresholds(list(y_test.columns))
+    return accuracy_score(y_test, (probabilities >= thresholds).astype(int))
+
+def measure(artifact, test_text, y_test, folder, name, repeat=LOAD_REPEAT):
+    """
+    Returns the file size, median load time and accuracy of a model.
+    """
+    path = os.path.join(folder, f"{name}.joblib")
+    joblib.dump(artifact, path)
+    load_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        joblib.load(path)
+        load_times.append(time.perf_counter() - start)
+    return {
+        'size_mb': os.path.getsize(path) / 2 ** 20,
+        'load_ms': statistics.median(load_times) * 1000,
+        'accuracy': model_accuracy(artifact, test_text, y_test)
+    }
+
+def report(data_path="Book1.csv", min_df=MIN_DF, max_features=MAX_FEATURES):
+    """
+    Trains a model (MLModelMLC_3.train_model, which holds out 30 % of the rows),
+    compacts it and prints size, load time and held-out accuracy of both.
+    Returns:
+        dict: 'full' and 'compact' measurements.
+    """
+    import MLModelMLC_3
+
+    print("Training a model on the training split...")
+    with contextlib.redirect_stdout(io.StringIO()):
+        vectorizer, best_clf_pipeline, categories, test_text, test, document_frequencies = \
+            MLModelMLC_3.train_model(data_path)
+    artifact = {'vectorizer': vectorizer, 'best_clf_pipeline': best_clf_pipeline,
+                'categories': categories, 'stemming': MLModelMLC_3.USE_STEMMING}
+    compact = compact_artifact(artifact, document_frequencies, min_df, max_features)
+    y_test = test.drop(labels=['Id', 'Heading'], axis=1)
+
+    with tempfile.TemporaryDirectory(prefix="compaction_") as folder:
+        results = {
+            'full': measure(artifact, test_text, y_test, folder, "full"),
+            'compact': measure(compact, test_text, y_test, folder, "compact")
+        }
+    results['full']['features'] = compact['compaction']['features_before']
+    results['compact']['features'] = compact['compaction']['features_after']
+
+    print(f"\n{'':<10} {'features':>10} {'size':>10} {'load':>10} {'accuracy':>10}")
+    for name, result in results.items():
+        print(f"{name:<10} {result['features']:>10} {result['size_mb']:>7.2f} MB {result['load_ms']:>7.1f} ms "
+              f"{result['accuracy']:>10.4f}")
+    full, small = results['full'], results['compact']
+    print(f"\nSize {small['size_mb'] / full['size_mb'] - 1:+.0%}, load time {small['load_ms'] / full['load_ms'] - 1:+.0%}, "
+          f"accuracy {small['accuracy'] - full['accuracy']:+.4f} on {len(test_text)} held-out headlines.")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the effect of compacting the model.")
+    parser.add_argument("--data", default="Book1.csv", help="labeled training CSV")
+    parser.add_argument("--min-df", type=int, default=MIN_DF, help="minimum document frequency of a feature")
+    parser.add_argument("--max-features", type=int, default=MAX_FEATURES,
+                        help="keep at most this many features, ranked by chi-squared")
+    args = parser.parse_args()
+
+    print('-----Starting ModelCompaction.py-----')
+    report(args.data, args.min_df, args.max_features)
+
+if __name__ == "__main__":
+    main()
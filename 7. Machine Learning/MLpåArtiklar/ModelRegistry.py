@@ -0,0 +1,109 @@
+# Description: Stores trained models as versioned artifacts on disk.
+# Every artifact is keyed by a hash of the training CSV and the training
+# configuration (hyperparameter grid etc.), so MLModelMLC_3 only has to retrain
+# when the data or the configuration changes. Artifacts are written uncompressed
+# with joblib so their numpy arrays can be memory-mapped when loaded.
+import hashlib
+import json
+import os
+import time
+
+import joblib
+
+# Default directory for model artifacts (next to the scripts, whatever the working directory)
+REGISTRY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+MANIFEST_NAME = "manifest.json"
+
+def artifact_key(data_path, config):
+    """
+    Computes the artifact key for a training CSV and a training configuration.
+    Args:
+        data_path (str): Path to the labeled training CSV.
+        config (dict): JSON-serializable training configuration.
+    Returns:
+        str: A short hex digest identifying the artifact.
+    """
+    digest = hashlib.sha256()
+    with open(data_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def artifact_path(key, registry_dir=REGISTRY_DIR):
+    """
+    Returns the file path of the artifact with the given key.
+    """
+    return os.path.join(registry_dir, f"model-{key}.joblib")
+
+def load_manifest(registry_dir=REGISTRY_DIR):
+    """
+    Reads the list of saved artifact versions (newest last).
+    """
+    try:
+        with open(os.path.join(registry_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return []
+
+def save_artifact(key, artifact, metadata=None, registry_dir=REGISTRY_DIR):
+    """
+    Saves a model artifact and records it in the manifest.
+    Args:
+        key (str): Artifact key from artifact_key().
+        artifact (dict): The objects to store (vectorizer, pipeline, categories, ...).
+        metadata (dict): Extra information for the manifest (config, metrics, ...).
+        registry_dir (str): Directory holding the artifacts.
+    Returns:
+        str: Path of the written artifact.
+    """
+    os.makedirs(registry_dir, exist_ok=True)
+    path = artifact_path(key, registry_dir)
+    tmp_path = f"{path}.tmp"
+    joblib.dump(artifact, tmp_path)  # Uncompressed, so arrays can be memory-mapped
+    os.replace(tmp_path, path)
+
+    manifest = [entry for entry in load_manifest(registry_dir) if entry["key"] != key]
+    manifest.append({
+        "key": key,
+        "path": os.path.basename(path),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        **(metadata or {})
+    })
+    _write_manifest(manifest, registry_dir)
+    return path
+
+def _write_manifest(manifest, registry_dir):
+    manifest_path = os.path.join(registry_dir, MANIFEST_NAME)
+    with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False, default=str)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+def remove_artifact(key, registry_dir=REGISTRY_DIR):
+    """
+    Deletes an artifact and its manifest entry (e.g. one superseded by an incremental update).
+    """
+    _write_manifest([entry for entry in load_manifest(registry_dir) if entry["key"] != key], registry_dir)
+    try:
+        os.remove(artifact_path(key, registry_dir))
+    except FileNotFoundError:
+        pass
+
+def load_artifact(key, registry_dir=REGISTRY_DIR, mmap_mode="r"):
+    """
+    Loads the artifact with the given key.
+    Args:
+        key (str): Artifact key from artifact_key().
+        registry_dir (str): Directory holding the artifacts.
+        mmap_mode (str): joblib memory-map mode for numpy arrays, None to load into memory.
+    Returns:
+        dict: The stored artifact, or None if no artifact exists for the key.
+    """
+    path = artifact_path(key, registry_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        return joblib.load(path, mmap_mode=mmap_mode)
+    except Exception as e:
+        print(f"Could not load model artifact {path}, it will be retrained: {e}")
+        return None
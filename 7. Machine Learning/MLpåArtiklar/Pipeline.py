@@ -0,0 +1,442 @@
+# Description: Runs the pipeline as a DAG of stages instead of through the
+# import chain of the numbered scripts:
+#
+#   fetch -> shape -----+
+#                       +-> classify -> validate -> store
+#   train --------------+
+#
+# Every stage writes its output to STAGE_DIR as a Parquet file named after a
+# hash of its inputs (the keys of the upstream outputs plus the stage settings),
+# except 'train', whose output is the model artifact in the registry. A stage
+# whose output for the current inputs already exists is skipped. Stages that do
+# not depend on each other (fetch and train) run concurrently. The keys of the
+# latest outputs are kept in STATE_PATH, so a single stage can be rerun from
+# the cached outputs of its inputs, e.g. only 'store' after a database failure.
+# The feed state of RssArticles_1 is saved only when a run that fetched also
+# stored, so articles of a failed store are fetched again by the next run.
+#
+# Usage: python Pipeline.py [--stages store] [--force] [--status]
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import RssArticles_1
+import FullRSSList_1_2
+import MLModelReturns_4
+import DbTransfer_5
+import ModelRegistry
+import Storage
+from ArticleBatch import ArticleBatch, SCHEMA
+
+# Directory holding the stage outputs
+STAGE_DIR = "pipeline_cache"
+
+# Keys of the latest output of every stage
+STATE_PATH = "pipeline_state.json"
+
+# Training data for the 'train' stage
+DATA_PATH = "Book1.csv"
+
+# Outputs kept per stage (older ones are deleted after a run)
+KEEP_OUTPUTS = 5
+
+# Stages run at the same time (fetch and train are the only independent ones)
+MAX_WORKERS = 2
+
+# Bumped when the output format of the stages changes, so old outputs are not reused
+VERSION = 1
+
+def stage_key(name, input_keys, settings=None):
+    """
+    Returns the output key of a stage: a hash of its name, its input keys and its settings.
+    """
+    payload = json.dumps([VERSION, name, input_keys, settings], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def file_key(path):
+    """
+    Returns a content hash of a file, used as key for outputs without inputs.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+def read_batches(path, batch_size=MLModelReturns_4.CHUNK_SIZE):
+    """
+    Yields the rows of a stage output as ArticleBatches of at most 'batch_size' rows.
+    """
+    import pyarrow.parquet as pq
+
+    for record_batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield ArticleBatch.from_table(record_batch)
+
+def calendar_seconds(parsed):
+    """
+    Converts a UTC time tuple to seconds since the epoch (None stays None).
+    """
+    import calendar
+
+    return calendar.timegm(parsed) if parsed else None
+
+class FetchStage:
+    """
+    Fetches the RSS feeds. It has no inputs, so it always runs and its output
+    is keyed by a hash of the fetched articles.
+    """
+
+    name = "fetch"
+    inputs = ()
+    feed_state = None  # Unsaved FeedStateCache of the latest fetch, saved after 'store'
+
+    def key(self, input_keys):
+        return None
+
+    def output_path(self, stage_dir, key):
+        return os.path.join(stage_dir, f"{self.name}-{key}.parquet")
+
+    def run(self, inputs):
+        import pyarrow as pa
+
+        self.feed_state = RssArticles_1.main()
+        posts = RssArticles_1.posts
+        yield pa.table({
+            'title': pa.array([post['title'] for post in posts], pa.string()),
+            'summary': pa.array([post['summary'] for post in posts], pa.string()),
+            'link': pa.array([post['link'] for post in posts], pa.string()),
+            'published': pa.array([post['published'] for post in posts], pa.string()),
+            # feedparser's UTC time tuple as seconds since the epoch
+            'published_parsed': pa.array([calendar_seconds(post['published_parsed']) for post in posts], pa.int64()),
+            'source': pa.array([post['source'] for post in posts], pa.string())
+        })
+        posts.clear()
+
+class TrainStage:
+    """
+    Trains the model, or finds it in the model registry. The key is the
+    registry key (training data and configuration).
+    """
+
+    name = "train"
+    inputs = ()
+
+    def key(self, input_keys):
+        import MLModelMLC_3
+
+        return ModelRegistry.artifact_key(DATA_PATH, MLModelMLC_3.training_config())
+
+    def output_path(self, stage_dir, key):
+        return ModelRegistry.artifact_path(key)
+
+    def run(self, inputs):
+        import MLModelMLC_3
+
+        # With an artifact for the current key the stage only runs because of --force
+        forced = os.path.exists(self.output_path(None, self.key({})))
+        MLModelMLC_3.main(DATA_PATH, force_retrain=forced)  # Incremental mode folds in the new rows
+        return iter(())  # The registry stores the model
+
+class ShapeStage:
+    """
+    Normalizes the fetched posts into records with a formatted 'published' date.
+    """
+
+    name = "shape"
+    inputs = ("fetch",)
+
+    def key(self, input_keys):
+        return stage_key(self.name, input_keys)
+
+    def output_path(self, stage_dir, key):
+        return os.path.join(stage_dir, f"{self.name}-{key}.parquet")
+
+    def run(self, inputs):
+        import pyarrow.parquet as pq
+
+        posts = pq.read_table(inputs['fetch']).to_pylist()
+        for post in posts:
+            seconds = post['published_parsed']
+            post['published_parsed'] = time.gmtime(seconds) if seconds is not None else None
+        yield ArticleBatch.from_records(FullRSSList_1_2.iter_records(posts), []).to_table()
+
+class ClassifyStage:
+    """
+    Predicts the categories of the shaped records with the trained model.
+    """
+
+    name = "classify"
+    inputs = ("shape", "train")
+
+    def key(self, input_keys):
+        return stage_key(self.name, input_keys, {
+            'threshold': MLModelReturns_4.THRESHOLD,
+            'category_thresholds': MLModelReturns_4.CATEGORY_THRESHOLDS
+        })
+
+    def output_path(self, stage_dir, key):
+        return os.path.join(stage_dir, f"{self.name}-{key}.parquet")
+
+    def run(self, inputs):
+        model = load_model(inputs['train'])
+        normalizer = model['normalizer']
+        empty = True
+        for batch in read_batches(inputs['shape']):
+            MLModelReturns_4.classify_chunk(batch, model['vectorizer'], model['best_clf_pipeline'],
+                                            model['categories'], normalizer)
+            empty = False
+            yield batch.to_table()
+        if empty:  # Keeps the category columns in the output
+            yield ArticleBatch([], [], [], [], categories=model['categories']).to_table()
+        if normalizer.stemmer:
+            normalizer.stemmer.save()
+
+def load_model(path):
+    """
+    Loads the model artifact at 'path' in the form MLModelReturns_4.load_model() returns.
+    """
+    import joblib
+    import MLModelMLC_3
+
+    artifact = joblib.load(path, mmap_mode="r")
+    return {
+        'categories': artifact['categories'],
+        'vectorizer': artifact['vectorizer'],
+        'best_clf_pipeline': MLModelReturns_4.fused_scorer(artifact['best_clf_pipeline']),
+        'normalizer': MLModelMLC_3.make_normalizer(artifact.get('stemming', False))
+    }
+
+class ValidateStage:
+    """
+    Keeps the classified records that match the article JSON schema.
+    """
+
+    name = "validate"
+    inputs = ("classify",)
+
+    def key(self, input_keys):
+        return stage_key(self.name, input_keys, SCHEMA)
+
+    def output_path(self, stage_dir, key):
+        return os.path.join(stage_dir, f"{self.name}-{key}.parquet")
+
+    def run(self, inputs):
+        import pyarrow.parquet as pq
+
+        empty = True
+        for batch in read_batches(inputs['classify']):
+            empty = False
+            yield MLModelReturns_4.validate_chunk(batch).to_table()
+        if empty:
+            yield pq.read_schema(inputs['classify']).empty_table()
+
+class StoreStage:
+    """
+    Inserts the validated records into the database. The output is a one-row
+    table with the number of articles and inserted rows; the key includes the
+    database, so the same articles are stored again in another database.
+    """
+
+    name = "store"
+    inputs = ("validate",)
+
+    def key(self, input_keys):
+        database = hashlib.sha256(Storage.DATABASE_URL.encode("utf-8")).hexdigest()  # No password in the key
+        return stage_key(self.name, input_keys, database)
+
+    def output_path(self, stage_dir, key):
+        return os.path.join(stage_dir, f"{self.name}-{key}.parquet")
+
+    def run(self, inputs):
+        import pyarrow as pa
+
+        storage = DbTransfer_5.db_connection()
+        if storage is None:
+            raise RuntimeError("No database connection could be established.")
+        articles = inserted = 0
+        for batch in read_batches(inputs['validate']):
+            articles += len(batch)
+            inserted += DbTransfer_5.insert_data(batch, storage, raise_errors=True)
+        yield pa.table({'articles': [articles], 'inserted': [inserted]})
+
+# The DAG in dependency order
+STAGES = {stage.name: stage for stage in (
+    FetchStage(), TrainStage(), ShapeStage(), ClassifyStage(), ValidateStage(), StoreStage()
+)}
+
+class PipelineRunner:
+    """
+    Runs the stages of STAGES in dependency order, independent stages concurrently.
+    Args:
+        stage_dir (str): Directory for the stage outputs.
+        state_path (str): JSON file with the keys of the latest stage outputs.
+        force (bool): Run the selected stages even if their output exists.
+        max_workers (int): Stages run at the same time.
+    """
+
+    def __init__(self, stage_dir=STAGE_DIR, state_path=STATE_PATH, force=False, max_workers=MAX_WORKERS):
+        self.stage_dir = stage_dir
+        self.state_path = state_path
+        self.force = force
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.state = self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Could not read pipeline state from {self.state_path}, starting empty: {e}")
+            return {}
+
+    def _record(self, stage, key, path, items, seconds, skipped):
+        """
+        Remembers the latest output of a stage and writes the state file atomically.
+        """
+        with self.lock:
+            self.state[stage.name] = {
+                'key': key,
+                'path': path,
+                'items': items,
+                'seconds': round(seconds, 3),
+                'skipped': skipped,
+                'finished': time.strftime("%Y-%m-%d %H:%M:%S")
+            }
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.state_path)
+
+    def run_stage(self, stage, input_keys):
+        """
+        Runs one stage unless its output for these inputs already exists.
+        Args:
+            stage: A stage from STAGES.
+            input_keys (dict): Output key of every input stage.
+        Returns:
+            str: The key of the stage output.
+        """
+        import pyarrow.parquet as pq
+
+        start = time.perf_counter()
+        key = stage.key(input_keys)
+        if key is not None and not self.force and os.path.exists(stage.output_path(self.stage_dir, key)):
+            path = stage.output_path(self.stage_dir, key)
+            print(f"Stage '{stage.name}' is unchanged, reusing {path}.")
+            previous = self.state.get(stage.name, {})
+            self._record(stage, key, path, previous.get('items') if previous.get('key') == key else None,
+                         time.perf_counter() - start, True)
+            return key
+
+        print(f"-----Running stage '{stage.name}'-----")
+        inputs = {name: STAGES[name].output_path(self.stage_dir, input_key) for name, input_key in input_keys.items()}
+        os.makedirs(self.stage_dir, exist_ok=True)
+        tmp_path = os.path.join(self.stage_dir, f"{stage.name}-{threading.get_ident()}.tmp")
+        writer, items = None, 0
+        try:
+            for table in stage.run(inputs):  # Chunks are written as they are produced
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table)
+                items += table.num_rows
+        except BaseException:
+            if writer is not None:  # A partial output is never kept
+                writer.close()
+                os.remove(tmp_path)
+            raise
+        if writer is not None:
+            writer.close()
+            key = key or file_key(tmp_path)
+            os.replace(tmp_path, stage.output_path(self.stage_dir, key))
+        else:
+            items = None  # The stage stores its output itself (the model registry)
+        path = stage.output_path(self.stage_dir, key)
+        seconds = time.perf_counter() - start
+        rows = f"{items} rows, " if items is not None else ""
+        print(f"Stage '{stage.name}' finished in {seconds:.2f} seconds ({rows}{path}).")
+        self._record(stage, key, path, items, seconds, False)
+        return key
+
+    def run(self, stages=None):
+        """
+        Runs the selected stages (all when None). Inputs from stages that are
+        not selected are read from their latest cached outputs.
+        Returns:
+            dict: Stage name -> output key.
+        """
+        selected = [name for name in STAGES if stages is None or name in stages]
+        keys = {name: entry['key'] for name, entry in self.state.items() if name not in selected}
+        for name in selected:
+            for dependency in STAGES[name].inputs:
+                if dependency not in selected and dependency not in keys:
+                    raise ValueError(f"Stage '{name}' needs the output of '{dependency}'; run that stage first.")
+
+        pending, running = list(selected), {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name in [name for name in pending if all(dep in keys for dep in STAGES[name].inputs)]:
+                    pending.remove(name)
+                    input_keys = {dep: keys[dep] for dep in STAGES[name].inputs}
+                    running[executor.submit(self.run_stage, STAGES[name], input_keys)] = name
+                if not running:
+                    raise RuntimeError(f"Stages {pending} cannot run, their inputs are missing.")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    keys[running.pop(future)] = future.result()  # A failed stage stops the run
+        fetch = STAGES['fetch']
+        if "store" in selected and fetch.feed_state is not None:
+            fetch.feed_state.save()  # The fetched articles are stored now
+            fetch.feed_state = None
+        self.prune()
+        return keys
+
+    def prune(self, keep=KEEP_OUTPUTS):
+        """
+        Deletes all but the 'keep' newest outputs of every stage, never the latest ones.
+        """
+        if not os.path.isdir(self.stage_dir):
+            return
+        latest = {os.path.basename(entry['path']) for entry in self.state.values()}
+        for name in STAGES:
+            outputs = sorted((entry for entry in os.scandir(self.stage_dir)
+                              if entry.name.startswith(f"{name}-") and entry.name.endswith(".parquet")),
+                             key=lambda entry: entry.stat().st_mtime, reverse=True)
+            for entry in outputs[keep:]:
+                if entry.name not in latest:
+                    os.remove(entry.path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the news pipeline as a DAG of cached stages.")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES),
+                        help="run only these stages, reading other inputs from the cache")
+    parser.add_argument("--force", action="store_true", help="run the stages even if their output exists")
+    parser.add_argument("--status", action="store_true", help="show the latest output of every stage")
+    args = parser.parse_args()
+
+    runner = PipelineRunner(force=args.force)
+    if args.status:
+        for name in STAGES:
+            entry = runner.state.get(name)
+            if entry:
+                rows = entry['items'] if entry['items'] is not None else "-"
+                print(f"{name:<10} {entry['key']}  {entry['finished']}  {rows} rows"
+                      f"{'  (reused)' if entry['skipped'] else ''}")
+            else:
+                print(f"{name:<10} not run")
+        return
+
+    print('-----Starting Pipeline.py-----')
+    start = time.perf_counter()
+    runner.run(set(args.stages) if args.stages else None)
+    print(f"Pipeline finished in {time.perf_counter() - start:.2f} seconds.")
+
+if __name__ == "__main__":
+    main()
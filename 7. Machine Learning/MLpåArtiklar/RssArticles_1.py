@@ -1,6 +1,21 @@
 # Description: This script fetches articles from a list of RSS feeds and
 #  stores them in a list of dictionaries.
-import feedparser  
+# The feeds are downloaded concurrently by a bounded thread pool, so a run
+# takes as long as the slowest feed instead of the sum of all feeds.
+# Feeds that have not changed since the last run (HTTP 304 or an identical
+# body) are skipped without parsing, see FeedStateCache.py. main() returns the
+# updated feed state without saving it: the caller saves it once the articles
+# are stored, so a failed store does not make the next run skip them.
+import gzip
+import http.client
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import feedparser
+
+from FeedStateCache import FeedStateCache, STATE_PATH, content_hash
+import Instrumentation
 
 # List of RSS feed URLs
 RSS_URLS = [
@@ -12,25 +27,206 @@ RSS_URLS = [
     'http://www.svt.se/nyheter/rss.xml'
 ]
 
+# Fetch settings (seconds). The connect and read timeouts apply to each feed,
+# the deadline applies to the whole collection run.
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+GLOBAL_DEADLINE = 30
+MAX_WORKERS = 16
+MAX_REDIRECTS = 5
+USER_AGENT = "MLpaArtiklar/1.0 (+feedparser)"
+
 # Create an empty list to store articles
 posts = []
 
-def main():
-    print('-----Starting Rssarticles_1.py-----')
-    for url in RSS_URLS:
+# Per-feed outcome of the latest run (url, status, number of articles, error, seconds)
+feed_results = []
+
+# Number of feeds skipped in the latest run because they had not changed
+skipped_feeds = 0
+
+# Feed statuses that mean "nothing new, parsing skipped"
+SKIPPED_STATUSES = ('not_modified', 'unchanged')
+
+def fetch_url(url, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, extra_headers=None):
+    """
+    Downloads a URL with separate connect and read timeouts, following redirects.
+    Args:
+        url (str): The URL to download.
+        connect_timeout (float): Seconds allowed to establish the connection.
+        read_timeout (float): Seconds allowed between received chunks of the response.
+        extra_headers (dict): Additional request headers, e.g. conditional-GET validators.
+    Returns:
+        tuple: (status code, dict of lower-cased response headers, body as bytes).
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme == "https":
+            cnxn = http.client.HTTPSConnection(parts.netloc, timeout=connect_timeout)
+        else:
+            cnxn = http.client.HTTPConnection(parts.netloc, timeout=connect_timeout)
         try:
-            feed = feedparser.parse(url)
-            for entry in feed.entries:
-                article = {
-                    'title': entry.get('title', ""),
-                    'summary': entry.get('summary', ""),
-                    'link': entry.get('link', ""),
-                    'published': entry.get('published', "")
-                }
-                posts.append(article)
-        except Exception as e:
-            print(f"Error parsing URL {url}: {e}")
-    print(f"Fetched {len(posts)} articles.")
+            cnxn.connect()
+            cnxn.sock.settimeout(read_timeout)  # From here on only the read timeout applies
+
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            cnxn.request("GET", path, headers={
+                "User-Agent": USER_AGENT,
+                "Accept-Encoding": "gzip",
+                **(extra_headers or {})
+            })
+            response = cnxn.getresponse()
+            headers = {key.lower(): value for key, value in response.getheaders()}
+            body = response.read()
+        finally:
+            cnxn.close()
+
+        if response.status in (301, 302, 303, 307, 308) and "location" in headers:
+            url = urllib.parse.urljoin(url, headers["location"])
+            continue
+        if response.status == 304:
+            return response.status, headers, b""
+        if response.status >= 400:
+            raise http.client.HTTPException(f"HTTP {response.status} {response.reason}")
+        if headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        return response.status, headers, body
+
+    raise http.client.HTTPException(f"Too many redirects for {url}")
+
+def entry_to_article(entry, source=None):
+    """
+    Converts a feedparser entry into the article dictionary used by the pipeline.
+    'published_parsed' is feedparser's already parsed date (UTC time tuple) and
+    'source' the feed URL, used to learn the date format per feed.
+    """
+    return {
+        'title': entry.get('title', ""),
+        'summary': entry.get('summary', ""),
+        'link': entry.get('link', ""),
+        'published': entry.get('published', ""),
+        'published_parsed': entry.get('published_parsed'),
+        'source': source
+    }
+
+def fetch_feed(url, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, state=None):
+    """
+    Downloads and parses one feed. Errors are caught and returned, never raised.
+    With a FeedStateCache the request is conditional, and the feed is not parsed
+    when the server answers 304 or the body is identical to the previous run.
+    The state itself is not changed here: the new validators are returned, and
+    collect_feeds only stores them for feeds that finished within the deadline.
+    Args:
+        url (str): The RSS feed URL.
+        connect_timeout (float): Seconds allowed to establish the connection.
+        read_timeout (float): Seconds allowed between received chunks of the response.
+        state (FeedStateCache): Optional per-feed state store.
+    Returns:
+        dict: The feed result with 'url', 'status', 'articles', 'error', 'seconds' and
+              'validators' ((headers, content hash) to remember, or None).
+              'status' is 'ok', 'not_modified', 'unchanged' or 'error'.
+    """
+    start = time.perf_counter()
+    try:
+        conditional_headers = state.request_headers(url) if state else None
+        status, headers, body = fetch_url(url, connect_timeout, read_timeout, conditional_headers)
+        if status == 304:
+            return {'url': url, 'status': 'not_modified', 'articles': [], 'error': None,
+                    'seconds': time.perf_counter() - start, 'validators': None}
+
+        digest = content_hash(body)
+        if state and state.is_unchanged(url, digest):
+            return {'url': url, 'status': 'unchanged', 'articles': [], 'error': None,  # Newest validators kept
+                    'seconds': time.perf_counter() - start, 'validators': (headers, digest)}
+
+        feed = feedparser.parse(body, response_headers=headers)
+        articles = [entry_to_article(entry, url) for entry in feed.entries]
+        return {'url': url, 'status': 'ok', 'articles': articles, 'error': None,
+                'seconds': time.perf_counter() - start, 'validators': (headers, digest)}
+    except Exception as e:
+        return {'url': url, 'status': 'error', 'articles': [], 'error': str(e) or type(e).__name__,
+                'seconds': time.perf_counter() - start, 'validators': None}
+
+def collect_feeds(urls, max_workers=MAX_WORKERS, deadline=GLOBAL_DEADLINE,
+                  connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, state=None):
+    """
+    Fetches all feeds concurrently with a bounded thread pool.
+    Feeds that have not finished when the global deadline passes are reported
+    as errors and their articles are left out of the run. Only the feeds that
+    finished in time update 'state', so a late feed is fetched again next run.
+    Args:
+        urls (list): RSS feed URLs.
+        max_workers (int): Maximum number of feeds downloaded at the same time.
+        deadline (float): Seconds allowed for the whole collection.
+        connect_timeout (float): Per-feed connect timeout in seconds.
+        read_timeout (float): Per-feed read timeout in seconds.
+        state (FeedStateCache): Optional per-feed state store for conditional requests.
+    Returns:
+        list: One feed result dictionary per URL, in the same order as 'urls'.
+    """
+    if not urls:
+        return []
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)))
+    futures = [executor.submit(fetch_feed, url, connect_timeout, read_timeout, state) for url in urls]
+    wait(futures, timeout=deadline)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for url, future in zip(urls, futures):
+        if future.done() and not future.cancelled():
+            result = future.result()
+            if state and result['validators']:
+                state.update(url, *result['validators'])
+            results.append(result)
+        else:
+            results.append({'url': url, 'status': 'error', 'articles': [],
+                            'error': f"Deadline of {deadline}s exceeded", 'seconds': deadline,
+                            'validators': None})
+    return results
+
+@Instrumentation.instrument("fetch")
+def main(urls=None, max_workers=MAX_WORKERS, deadline=GLOBAL_DEADLINE, state_path=STATE_PATH):
+    """
+    Fetches all feeds and stores their articles in 'posts'.
+    'posts' is emptied first, so repeated calls in one process do not accumulate.
+    Args:
+        urls (list): Feed URLs, defaults to RSS_URLS.
+        max_workers (int): Maximum number of concurrent downloads.
+        deadline (float): Seconds allowed for the whole collection.
+        state_path (str): Feed state file for conditional requests, None to always refetch.
+    Returns:
+        FeedStateCache: The updated, unsaved feed state (None without 'state_path').
+                        Call save() on it after the articles have been stored.
+    """
+    global skipped_feeds
+    print('-----Starting Rssarticles_1.py-----')
+    start = time.perf_counter()
+    state = FeedStateCache(state_path) if state_path else None
+    results = collect_feeds(RSS_URLS if urls is None else urls, max_workers, deadline, state=state)
+
+    posts.clear()
+    feed_results.clear()
+    for result in results:
+        posts.extend(result['articles'])
+        feed_results.append({
+            'url': result['url'],
+            'status': result['status'],
+            'articles': len(result['articles']),
+            'error': result['error'],
+            'seconds': result['seconds']
+        })
+        if result['error']:
+            print(f"Error parsing URL {result['url']}: {result['error']}")
+
+    skipped_feeds = sum(1 for result in results if result['status'] in SKIPPED_STATUSES)
+    Instrumentation.count(len(posts))
+    print(f"Fetched {len(posts)} articles from {len(results)} feeds "
+          f"in {time.perf_counter() - start:.2f} seconds.")
+    print(f"Skipped {skipped_feeds} unchanged feeds.")
+    return state
 
 if __name__ == "__main__":
     main()
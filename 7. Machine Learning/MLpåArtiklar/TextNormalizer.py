@@ -0,0 +1,194 @@
+# Description: Batched text normalization for Swedish headlines.
+# Used both when training the model (MLModelMLC_3) and when classifying new
+# RSS articles (MLModelReturns_4), so both paths see exactly the same text.
+# Every headline is cleaned in a single pass: HTML stripping, lowercasing,
+# punctuation/digit removal through a cached translate table, whitespace
+# tokenization and stopword removal through a frozenset lookup.
+# Optional Swedish stemming goes through CachedStemmer, which stems every
+# unique token only once.
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# Bump when the normalization output changes, so trained models are rebuilt
+VERSION = 1
+
+HTML_TAG = re.compile(r'<.*?>')
+
+# Default location of the persisted stem cache (next to the scripts, whatever the working directory)
+STEM_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stem_cache.json")
+
+class _CleanTable(dict):
+    """
+    Translate table for str.translate that is filled lazily, one code point at
+    a time: digits and punctuation are deleted, word characters and whitespace
+    are kept (the same classes as the regexes r'\\d+' and r'[^\\w\\s]').
+    """
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        if char.isdecimal() or not (char.isalnum() or char == '_' or char.isspace()):
+            value = None
+        else:
+            value = codepoint
+        self[codepoint] = value
+        return value
+
+CLEAN_TABLE = _CleanTable()
+
+_swedish_stopwords = None
+
+def swedish_stopwords():
+    """
+    Returns nltk's Swedish stopwords as a frozenset (loaded once per process).
+    """
+    global _swedish_stopwords
+    if _swedish_stopwords is None:
+        from nltk.corpus import stopwords  # Run nltk.download('stopwords') once if missing
+        _swedish_stopwords = frozenset(stopwords.words('swedish'))
+    return _swedish_stopwords
+
+def tokenize(text, stop_words):
+    """
+    Normalizes one text and returns its tokens without stopwords.
+    """
+    if not isinstance(text, str):
+        return []
+    text = HTML_TAG.sub(' ', text).lower().translate(CLEAN_TABLE)
+    return [word for word in text.split() if word not in stop_words]
+
+def _tokenize_chunk(texts, stop_words):
+    return [tokenize(text, stop_words) for text in texts]
+
+class CachedStemmer:
+    """
+    Swedish Snowball stemmer with a bounded LRU cache of token -> stem.
+    Headlines reuse a small vocabulary, so each batch only stems the tokens
+    it has not seen before and maps all rows through a plain dict lookup.
+    Args:
+        max_size (int): Maximum number of cached tokens.
+        path (str): JSON file to load the cache from and save it to, or None.
+    """
+
+    def __init__(self, max_size=200000, path=None):
+        from nltk.stem.snowball import SnowballStemmer
+        self._stem = SnowballStemmer("swedish").stem
+        self.max_size = max_size
+        self.path = path
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.cache = OrderedDict(json.load(f)[-self.max_size:])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Could not read stem cache from {self.path}, starting empty: {e}")
+
+    @property
+    def hit_rate(self):
+        """
+        Share of token lookups answered from the cache since creation.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stem_rows(self, token_rows):
+        """
+        Stems a batch of token lists.
+        Args:
+            token_rows (list): One list of tokens per text.
+        Returns:
+            list: One list of stems per text.
+        """
+        cache = self.cache
+        lookup = {}
+        total = 0
+        misses = 0
+        for tokens in token_rows:
+            total += len(tokens)
+            for token in tokens:
+                if token in lookup:
+                    continue
+                stem = cache.get(token)
+                if stem is None:
+                    stem = self._stem(token)
+                    misses += 1
+                    cache[token] = stem
+                    if len(cache) > self.max_size:
+                        cache.popitem(last=False)
+                else:
+                    cache.move_to_end(token)
+                lookup[token] = stem
+        self.misses += misses
+        self.hits += total - misses
+        return [[lookup[token] for token in tokens] for tokens in token_rows]
+
+    def save(self):
+        """
+        Writes the cache to 'path' (least recently used tokens first).
+        """
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(list(self.cache.items()), f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+class TextNormalizer:
+    """
+    Normalizes batches of headlines into space-separated token strings.
+    Args:
+        stop_words (frozenset): Words to remove, defaults to nltk's Swedish stopwords.
+        n_jobs (int): Number of worker processes for large batches (1 = in-process).
+        chunk_size (int): Number of texts sent to a worker at a time.
+        stemmer (CachedStemmer): Optional stemmer applied after stopword removal.
+    """
+
+    def __init__(self, stop_words=None, n_jobs=1, chunk_size=5000, stemmer=None):
+        self.stop_words = frozenset(stop_words) if stop_words is not None else swedish_stopwords()
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.stemmer = stemmer
+        self.throughput = 0.0  # Headlines per second of the latest batch
+
+    def tokens(self, text):
+        """
+        Returns the normalized (and stemmed, if enabled) tokens of a single text.
+        """
+        tokens = tokenize(text, self.stop_words)
+        if self.stemmer:
+            tokens = self.stemmer.stem_rows([tokens])[0]
+        return tokens
+
+    def normalize_batch(self, texts):
+        """
+        Normalizes a batch of texts.
+        Args:
+            texts (iterable): Headlines (non-strings are treated as empty).
+        Returns:
+            list: One normalized, space-separated string per input text.
+        """
+        texts = list(texts)
+        start = time.perf_counter()
+        if self.n_jobs != 1 and len(texts) > self.chunk_size:
+            chunks = [texts[i:i + self.chunk_size] for i in range(0, len(texts), self.chunk_size)]
+            with ProcessPoolExecutor(max_workers=None if self.n_jobs == -1 else self.n_jobs) as executor:
+                results = executor.map(_tokenize_chunk, chunks, [self.stop_words] * len(chunks))
+                token_rows = [tokens for chunk in results for tokens in chunk]
+        else:
+            token_rows = _tokenize_chunk(texts, self.stop_words)
+        if self.stemmer:
+            token_rows = self.stemmer.stem_rows(token_rows)
+        normalized = [" ".join(tokens) for tokens in token_rows]
+        elapsed = time.perf_counter() - start
+        self.throughput = len(texts) / elapsed if elapsed > 0 else 0.0
+        return normalized